@@ -13,202 +13,149 @@
 
     Command line:
     python "pathToFile/BOM.py" "%I" "%O"
+    python "pathToFile/BOM.py" --cache-dir DIR "%I" "%O"
+    python "pathToFile/BOM.py" --profile "%I" "%O"
+
+    From python:
+    import BOM
+    BOM.sync_bom("board.xml", "board-bom.xlsx", BOM.SyncOptions(cache_dir=DIR))
 """
 
-# Import the KiCad python helper module and XLS tools
+# Import the KiCad python helper module.
+# The XLS tools (openpyxl) are imported when they are first needed
 import netlist_reader
 from translate_fp import translate_fp
-import openpyxl
+import sync_stats
+import argparse
+import functools
+import hashlib
+import json
+import os
 import sys
 
-if not len(sys.argv) >= 3:
-    print("Command line:\npython \"pathToFile/BOM.py\" bom-from-KiCad.xml generated-bom-xlsx-file")
-    print("Command line (from KiCad):\npython \"pathToFile/BOM.py\" \"%I\" \"%O\"")
-    sys.exit()
-
-# Generate an instance of a generic netlist, and load the netlist tree from
-# the command line option. If the file doesn't exist, execution will stop
-net = netlist_reader.netlist(sys.argv[1])
-
-# Open a file to write to, if the file cannot be opened output to stdout
-# instead
-xlsfile = sys.argv[2] + '.xlsx'
-
 
 header_names = ['Ref', 'Footprint', 'Value', 'Rating', 'Qty', 'MPN', 'Farnell', 'Mouser', 'Digikey']
 
 # Get all of the components in groups of matching value + footprint
 
-# A custom compare / grouping can be defined (for instance named myEqu):
-# add the line:
-#    kicad_netlist_reader.comp.__eq__ = myEqu
-# in this bom generator script before calling the netliste reader by something like:
-#    net = kicad_netlist_reader.netlist(sys.argv[1])
+# A custom grouping can be defined by passing a key function (for instance
+# named myKey) that returns a hashable key per component:
+#    grouped = net.groupComponents(key=myKey)
+# components with the same key end up in the same group.
 # see netlist_reader.py for more info
 
-components = net.components
-grouped = net.groupComponents()
-
-
-def init_BOM_sheet(xls):
-    sheet = xls['BOM']
-    sheet.insert_rows(1)
-    headers = ['Sync'] + header_names
-    for i, col in enumerate(headers):
-        col_no = i + 1
-        cell = sheet.cell(column=col_no, row=1)
-        cell.value = col
-        cell.font = cell.font.copy(bold=True)
-
-try:
-    xls = openpyxl.load_workbook(xlsfile)
-
-# Create a new empty sheet with only the headers.
-# The rest of the sync process will add all the data
-except FileNotFoundError:
-    xls = openpyxl.Workbook()
-    xls.active.title = 'BOM'
-    init_BOM_sheet(xls)
-
-if not 'BOM' in xls:
-    print("WARNING: xls file {} did not contain a 'BOM' worksheet, adding new sheet..".format(xlsfile))
-    xls.create_sheet('BOM')
-    init_BOM_sheet(xls)
-
-# Build a lookup from column header -> column index
-sheet = xls['BOM']
-col_lookup = {}
-col = 0
-while(True):
-    col+=1
-    val = sheet.cell(column=col,row=1).value
-    if val is None:
-        break
-    col_lookup[val] = (col - 1)
-
-if not 'Value' in col_lookup or not 'Footprint' in col_lookup:
-    print("ERROR: xls file {} does not have 'Value' and 'Footprint' colums".format(xlsfile))
-    sys.exit()
-
-## XLS: styling
-
-# New part
-new_color = openpyxl.styles.colors.Color(rgb='0000F200')
-new_fill = openpyxl.styles.fills.PatternFill(patternType='solid', fgColor=new_color)
+# Parts that are left out of the BOM (DNI: Do Not Install):
+# - the value starts with 'DNI', or is 'DNP', 'LOGO', 'mousebite' or 'inf'
+# - a non-empty DNI/DNP field or the 'dnp' property (KiCad7+) is found
+bom_filter = netlist_reader.componentFilter(
+        references=[],
+        values=[r'\s*DNI', r'\s*(DNP|LOGO|mousebite|inf)\s*$'],
+        footprints=[],
+        fields={'DNI': None, 'DNP': None, 'dnp': None},
+        dnp=True)
 
-# Changed part
-changed_color = openpyxl.styles.colors.Color(rgb='00FFF200')
-changed_fill = openpyxl.styles.fills.PatternFill(patternType='solid', fgColor=changed_color)
 
-# Translated content (e.g. simplfied footprint name)
-translate_color = openpyxl.styles.colors.Color(rgb='007DF2E6')
-translate_fill = openpyxl.styles.fills.PatternFill(patternType='solid', fgColor=translate_color)
+class SyncOptions:
+    """Options of sync_bom(), see the command line help of the same name"""
+    def __init__(self, cache_dir=None, force_save=False, check=False):
+        self.cache_dir = cache_dir
+        self.force_save = force_save
+        self.check = check
 
-# Obsolete part: part is not in the Kicad design anymore
-obsolete_color = openpyxl.styles.colors.Color(rgb='00F20000')
-obsolete_fill = openpyxl.styles.fills.PatternFill(patternType='solid', fgColor=obsolete_color)
 
-# Default style
-none_fill = openpyxl.styles.fills.PatternFill(patternType=None)
+def load_netlist(fname, cache_dir=None):
+    """Load a KiCad generic netlist. If the file doesn't exist, execution
+    will stop. The BOM does not need the nets and libraries: skip those
+    while parsing"""
+    with sync_stats.phase('parse'):
+        return netlist_reader.netlist(fname, skip=('nets', 'libraries'),
+                                      cacheDir=cache_dir)
 
-## XLS: prepare by clearing the sync column
-if 'Sync' in col_lookup:
-    col_no = col_lookup['Sync']+1
-    for r in range(sheet.max_row)[1:]:
-        row_no = r+1
-        cell = sheet.cell(column=col_no, row=row_no)
-        cell.value = None
-        cell.fill = none_fill
-else:
-    print("WARNING: xls file {} does not have a 'Sync' column."
-            "This means you cannot detect obsolete entries...".format(xlsfile))
 
+def get_parts(grouped):
+    """Return a list of parts (dicts of BOM column -> value), one per group"""
+    parts = []
+    for group in grouped:
+        refs = ""
 
+        # Add the reference of every component in the group and keep a reference
+        # to the component so that the other data can be filled in once per group
 
-last_updated_row = 1
-def update_xls(part):
-    global last_updated_row
+        ratings = set()
 
-    for row in sheet.iter_rows():
+        filtered_group = []
+        for component in group:
 
-        xls_val = row[col_lookup['Value']].value
-        xls_fp = row[col_lookup['Footprint']].value
+            # Skip DNI parts, see bom_filter
+            if bom_filter.excludes(component):
+                continue
 
-        # Not the right row: skip
-        if not xls_val == part['Value'] or not translate_fp(xls_fp) == translate_fp(part['Footprint']):
+            record = component.getRecord()
+            refs += record.ref + ", "
+            filtered_group.append(component)
+            c = record
+
+            # Gather all component ratings for this group of components.
+            # All unique ratings are combined into one field in the BOM.
+            # While ordering, a component should be selected that satisfies all of them
+            rating = str(record.getField("Rating") or record.getField("rating")).strip()
+            for r in rating.split(','):
+                if len(r):
+                    ratings.add(r)
+
+        # Skip empty groups
+        if len(refs) <= 0:
             continue
 
-        # Matching row found: mark it as 'in sync'
-        if 'Sync' in col_lookup:
-            row[col_lookup['Sync']].value = 1
-
-        # Check each property agains the XLS value in the corresponding column
-        first_change = True
+        # Convert ratings from 'set' to a CSV-string.
+        # Sorting is to guarantee reproducibility
+        ratings = list(ratings)
+        ratings.sort()
+        ratings = ','.join(ratings)
+
+        part = {}
+        part['Ref'] = refs
+        part['Qty'] = len(filtered_group)
+        part['Value'] = c.value
+        part['Footprint'] = c.footprint
+        part['Description'] = c.description
+        part['Rating'] = ratings
+        part['MPN'] = c.getField("MPN")
+        part['Farnell'] = c.getField("Farnell")
+        part['Mouser'] = c.getField("Mouser")
+        part['Digikey'] = c.getField("Digikey")
+
+        # Avoid whitespace mismatch
         for prop in part:
-            new_value = str(part[prop]).strip()
+            part[prop] = str(part[prop]).strip()
 
-            if prop == 'Footprint':
-                new_value = translate_fp(new_value)
 
-            if prop == 'Qty':
-                new_value = int(new_value)
+        parts.append(part)
+    return parts
 
-            # no value is set: skip
-            if not new_value:
-                continue
-
-            # column not in sheet: skip
-            if not prop in col_lookup:
-                continue
 
-            col_index = col_lookup[prop]
-            old_value = str(row[col_index].value).strip()
-            if not old_value == str(new_value):
-                if first_change:
-                    first_change = False
-                    print("Change(s) found for component with value='{}', "
-                            "footprint '{}':".format(xls_val, xls_fp))
-                print("'{}' changed from '{}' to '{}'".format(prop, old_value, new_value))
-
-                # This can only be because of changes in translation,
-                # otherwise this row would not have matched
-                if prop == 'Footprint':
-                    print("Translated")
-                    row[col_index].fill = translate_fill
-                else:
-                    row[col_index].fill = changed_fill
-
-                row[col_index].value = new_value
-        last_updated_row = row[0].row
-        return
-
-    # No matching row was found: insert a new one
-    print("New component found with value='{}', "
-            "footprint '{}':".format(part['Value'], part['Footprint']))
-
-    last_updated_row+=1
-
-    if len(list(sheet.rows)) < last_updated_row:
-        # Append new row to sheet by writing a dummy value
-        # (dummy value is overwritten, but forces sheet.rows[i] to exist)
-        sheet.cell(row=last_updated_row,column=1).value='dummy'
-    else:
-        # Insert new row before given index
-        sheet.insert_rows(last_updated_row)
+def netlist_parts(net):
+    """Group the components of a netlist and return the BOM parts"""
+    with sync_stats.phase('grouping'):
+        grouped = net.groupComponents()
 
+    # Filtering: the DNI parts are left out while building the parts
+    with sync_stats.phase('filtering'):
+        return get_parts(grouped)
 
-    for prop in part:
-        new_value = str(part[prop]).strip()
 
-        # no value is set: skip
-        if not new_value:
-            continue
+def part_key(part):
+    """Key to match a part with a sheet row, see bomSync.row_key()"""
+    return (part['Value'], translate_fp(part['Footprint']))
 
-        # column not in sheet: skip
-        if not prop in col_lookup:
-            continue
 
-        row = list(sheet.rows)[last_updated_row-1]
+def part_values(part, col_lookup):
+    """Yield (property, value) for each property of the part as it should be
+    written to the sheet. Empty properties and properties without a column
+    in the sheet are skipped.
+    """
+    for prop in part:
+        new_value = str(part[prop]).strip()
 
         # Footprint is 'special': translate it to more readable format
         if prop == 'Footprint':
@@ -217,98 +164,699 @@ def update_xls(part):
         if prop == 'Qty':
             new_value = int(new_value)
 
-        # update property
-        col_index = col_lookup[prop]
-        row[col_index].fill = new_fill
-        row[col_index].value = new_value
-
-        # Matching row found: mark it as 'in sync'
-        if 'Sync' in col_lookup:
-            row[col_lookup['Sync']].fill = new_fill
-            row[col_lookup['Sync']].value = 1
-
-
-
-## Output all of the component information
-for group in grouped:
-    refs = ""
+        # no value is set: skip
+        if not new_value:
+            continue
 
-    # Add the reference of every component in the group and keep a reference
-    # to the component so that the other data can be filled in once per group
+        # column not in sheet: skip
+        if not prop in col_lookup:
+            continue
 
-    ratings = set()
+        yield prop, new_value
 
-    filtered_group = []
-    for component in group:
 
-        # Skip DNI parts based on value prefix
-        value = component.getValue().strip()
-        if value.startswith('DNI') or value in ['DNI', 'DNP', 'LOGO', 'mousebite', 'inf']:
+def part_changes(part, col_lookup, row_values):
+    """Compare a part with the values of its (matching) row in the sheet.
+    Returns a list of (property, old value, new value) for each property that
+    differs.
+    """
+    changes = []
+    for prop, new_value in part_values(part, col_lookup):
+        col_index = col_lookup[prop]
+        old_value = row_values[col_index] if col_index < len(row_values) else None
+        old_value = str(old_value).strip()
+        if not old_value == str(new_value):
+            changes.append((prop, old_value, new_value))
+    return changes
+
+
+def check_xls(parts, xlsfile, xls=None):
+    """Compare the parts with the BOM sheet without changing it. Unless an
+    (already loaded) workbook is given, the xlsx file is opened in read-only
+    mode, which streams the rows instead of loading the whole workbook.
+
+    Prints all new, changed and obsolete parts, and returns the exit code:
+    0 if the BOM is in sync, 1 if it is not.
+    """
+    close = xls is None
+    if xls is None:
+        import openpyxl
+        try:
+            xls = openpyxl.load_workbook(xlsfile, read_only=True)
+        except FileNotFoundError:
+            print("BOM {} does not exist: {} new components".format(xlsfile, len(parts)))
+            return 1
+    elif xlsfile is None:
+        # Name used in the messages
+        xlsfile = 'workbook'
+
+    try:
+        if not 'BOM' in xls:
+            print("ERROR: xls file {} does not contain a 'BOM' worksheet".format(xlsfile))
+            return 1
+
+        rows = xls['BOM'].iter_rows(values_only=True)
+
+        # Build a lookup from column header -> column index
+        check_col_lookup = {}
+        for col, val in enumerate(next(rows, ())):
+            if val is None:
+                break
+            check_col_lookup[val] = col
+
+        if not 'Value' in check_col_lookup or not 'Footprint' in check_col_lookup:
+            print("ERROR: xls file {} does not have 'Value' and 'Footprint' colums".format(xlsfile))
+            return 1
+
+        def value(row_values, col_name):
+            col_index = check_col_lookup[col_name]
+            return row_values[col_index] if col_index < len(row_values) else None
+
+        # Index the rows like bomSync.index_rows(). Rows that don't end up
+        # matched with a part are obsolete
+        check_index = {}
+        all_rows = []
+        for row_values in rows:
+            key = (value(row_values, 'Value'), translate_fp(value(row_values, 'Footprint')))
+            check_index.setdefault(key, row_values)
+            all_rows.append(row_values)
+        sync_stats.count('rows scanned', len(all_rows))
+    finally:
+        if close:
+            xls.close()
+
+    new = 0
+    changed = 0
+    matched = set()
+    for part in parts:
+        row_values = check_index.get(part_key(part))
+        if row_values is None:
+            new += 1
+            print("New component with value='{}', "
+                    "footprint '{}'".format(part['Value'], part['Footprint']))
             continue
 
-        # Skip DNI parts if non-empty DNI/DNP field or 'dnp' property (KiCad7+) is found
-        elif component.getDNP() or component.getField("DNI") or component.getField("DNP") or component.getField("dnp"):
+        matched.add(id(row_values))
+        changes = part_changes(part, check_col_lookup, row_values)
+        if changes:
+            changed += 1
+            print("Changed component with value='{}', "
+                    "footprint '{}':".format(part['Value'], part['Footprint']))
+            for prop, old_value, new_value in changes:
+                print("'{}' differs: '{}' in BOM, '{}' in KiCad".format(prop, old_value, new_value))
+
+    obsolete = 0
+    for row_values in all_rows:
+        if id(row_values) in matched:
             continue
+        val = value(row_values, 'Value')
+        fp = value(row_values, 'Footprint')
+        if val or fp:
+            obsolete += 1
+            print("Obsolete component with value='{}', "
+                    "footprint '{}'".format(val, fp))
 
-        refs += component.getRef() + ", "
-        filtered_group.append(component)
-        c = component
-
-        # Gather all component ratings for this group of components.
-        # All unique ratings are combined into one field in the BOM.
-        # While ordering, a component should be selected that satisfies all of them
-        rating = str(component.getField("Rating") or component.getField("rating")).strip()
-        for r in rating.split(','):
-            if len(r):
-                ratings.add(r)
-
-    # Skip empty groups
-    if len(refs) <= 0:
-        continue
-
-    # Convert ratings from 'set' to a CSV-string.
-    # Sorting is to guarantee reproducibility
-    ratings = list(ratings)
-    ratings.sort()
-    ratings = ','.join(ratings)
-
-    part = {}
-    part['Ref'] = refs
-    part['Qty'] = len(filtered_group)
-    part['Value'] = c.getValue()
-    part['Footprint'] = c.getFootprint()
-    part['Description'] = c.getDescription()
-    part['Rating'] = ratings
-    part['MPN'] = c.getField("MPN")
-    part['Farnell'] = c.getField("Farnell")
-    part['Mouser'] = c.getField("Mouser")
-    part['Digikey'] = c.getField("Digikey")
-
-    # Avoid whitespace mismatch
-    for prop in part:
-        part[prop] = str(part[prop]).strip()
+    if new or changed or obsolete:
+        print("BOM {} is NOT in sync: {} new, {} changed, {} obsolete".format(
+                xlsfile, new, changed, obsolete))
+        return 1
 
+    print("BOM {} is in sync".format(xlsfile))
+    return 0
 
-    update_xls(part)
 
+def init_BOM_sheet(xls):
+    sheet = xls['BOM']
+    sheet.insert_rows(1)
+    headers = ['Sync'] + header_names
+    for i, col in enumerate(headers):
+        col_no = i + 1
+        cell = sheet.cell(column=col_no, row=1)
+        cell.value = col
+        cell.font = cell.font.copy(bold=True)
 
 
-## XLS: style all obsolete entries
-if 'Sync' in col_lookup:
-    print("Styling obsolete entries")
-    col_no = col_lookup['Sync']+1
-    for r in range(sheet.max_row)[1:]:
-        row_no = r+1
-        cell = sheet.cell(column=col_no, row=row_no)
-        if not cell.value:
-            val = sheet.cell(column=col_lookup['Value']+1, row=row_no).value
-            fp = sheet.cell(column=col_lookup['Footprint']+1, row=row_no).value
-            if val or fp:
+## XLS: styling
+@functools.lru_cache(maxsize=None)
+def fills():
+    """Return the fills used to mark the synced cells, by name"""
+    import openpyxl
+
+    def solid(rgb):
+        color = openpyxl.styles.colors.Color(rgb=rgb)
+        return openpyxl.styles.fills.PatternFill(patternType='solid', fgColor=color)
+
+    return {
+        # New part
+        'new': solid('0000F200'),
+        # Changed part
+        'changed': solid('00FFF200'),
+        # Translated content (e.g. simplfied footprint name)
+        'translate': solid('007DF2E6'),
+        # Obsolete part: part is not in the Kicad design anymore
+        'obsolete': solid('00F20000'),
+        # Default style
+        'none': openpyxl.styles.fills.PatternFill(patternType=None),
+    }
+
+
+## Incremental sync: remember a hash per group from the previous run
+#
+# For each part synced to the sheet, the sidecar file stores a hash of the
+# part data from KiCad and a hash of its row in the sheet after the sync.
+# If both are still the same, the row is already in sync with the part.
+# (The row hash makes sure manual edits in the sheet are still detected)
+#
+# The sidecar also stores the (size, mtime) of the xlsx file after the sync.
+# If the file is still the same, nobody edited the sheet: the rows don't
+# need to be hashed again.
+SYNC_STATE_VERSION = 2
+
+def sync_state_path(xlsfile):
+    return os.path.join(os.path.dirname(xlsfile),
+                        '.' + os.path.basename(xlsfile) + '.sync')
+
+def file_stamp(fname):
+    """(size, mtime) of a file, or None if it does not exist"""
+    try:
+        st = os.stat(fname)
+    except OSError:
+        return None
+    return (st.st_size, st.st_mtime_ns)
+
+def load_sync_state(sync_state_file):
+    """Return the part key -> (part hash, row hash) lookup of the last sync,
+    and the file_stamp() of the xlsx file after that sync"""
+    try:
+        with open(sync_state_file) as f:
+            state = json.load(f)
+        if state.get('version') != SYNC_STATE_VERSION:
+            return {}, None
+        stamp = state['workbook']
+        return ({(v, fp): (part_hash, row_hash)
+                 for v, fp, part_hash, row_hash in state['groups']},
+                tuple(stamp) if stamp else None)
+    except (OSError, ValueError, KeyError, TypeError):
+        # No (usable) state: sync everything
+        return {}, None
+
+def save_sync_state(sync_state_file, state, workbook_stamp=None):
+    groups = [[v, fp, part_hash, row_hash]
+              for (v, fp), (part_hash, row_hash) in state.items()]
+    try:
+        with open(sync_state_file, 'w') as f:
+            json.dump({'version': SYNC_STATE_VERSION, 'workbook': workbook_stamp,
+                       'groups': groups}, f)
+    except OSError as e:
+        print("WARNING: could not save sync state {}: {}".format(sync_state_file, e))
+
+def hash_part(part):
+    return hashlib.sha1(json.dumps(part, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+class bomSync:
+    """
+    Sync the parts of a netlist with the 'BOM' sheet of a workbook.
+
+    xlsfile is the path of the xlsx file. If no (already loaded) workbook is
+    given, it is loaded from xlsfile, or created if the file does not exist.
+    The sync state of the incremental sync is kept next to xlsfile, unless
+    xlsfile is None.
+
+    The same bomSync can sync the workbook again (e.g. after the netlist
+    changed): the row index is kept, and the rows added by a sync are
+    added to it.
+    """
+    def __init__(self, xlsfile, xls=None):
+        self.xlsfile = xlsfile
+        self.name = xlsfile or 'workbook'
+        self.xls = xls
+        self.sheet = None
+        self.col_lookup = {}
+        self.row_index = None
+
+        # Set when any cell value or style in the workbook changed:
+        # if nothing changed, the workbook does not need to be saved
+        self.workbook_changed = False
+
+        self.sync_state_file = sync_state_path(xlsfile) if xlsfile else None
+        self.sync_state = {}
+        self.new_sync_state = {}
+        # file_stamp() of the xlsx file in the sync state
+        self.state_stamp = None
+        # The sync state that the rows of the sheet in memory are known to
+        # match (e.g. the xlsx file did not change since it was written):
+        # its row hashes don't need to be checked
+        self.sheet_state = None
+
+    def open(self):
+        """Load the workbook and find the columns of the BOM sheet.
+        Returns False if the sheet cannot be synced."""
+        loaded_stamp = None
+        if self.xls is None:
+            import openpyxl
+            try:
+                loaded_stamp = file_stamp(self.xlsfile)
+                with sync_stats.phase('workbook load'):
+                    self.xls = openpyxl.load_workbook(self.xlsfile)
+
+            # Create a new empty sheet with only the headers.
+            # The rest of the sync process will add all the data
+            except FileNotFoundError:
+                self.xls = openpyxl.Workbook()
+                self.xls.active.title = 'BOM'
+                init_BOM_sheet(self.xls)
+                self.workbook_changed = True
+
+        if not 'BOM' in self.xls:
+            print("WARNING: xls file {} did not contain a 'BOM' worksheet, adding new sheet..".format(self.name))
+            self.xls.create_sheet('BOM')
+            init_BOM_sheet(self.xls)
+            self.workbook_changed = True
+
+        # Build a lookup from column header -> column index
+        self.sheet = self.xls['BOM']
+        self.col_lookup = {}
+        col = 0
+        while(True):
+            col+=1
+            val = self.sheet.cell(column=col,row=1).value
+            if val is None:
+                break
+            self.col_lookup[val] = (col - 1)
+
+        if not 'Value' in self.col_lookup or not 'Footprint' in self.col_lookup:
+            print("ERROR: xls file {} does not have 'Value' and 'Footprint' colums".format(self.name))
+            return False
+
+        if self.sync_state_file:
+            self.sync_state, self.state_stamp = load_sync_state(self.sync_state_file)
+            if loaded_stamp is not None and loaded_stamp == self.state_stamp:
+                self.sheet_state = self.sync_state
+        return True
+
+    def row_key(self, row):
+        """Key to match a sheet row with a part: (Value, translated Footprint)"""
+        return (row[self.col_lookup['Value']].value,
+                translate_fp(row[self.col_lookup['Footprint']].value))
+
+    def index_rows(self):
+        """Build a lookup from row_key -> row (a tuple of cells) for all rows
+        in the sheet. If multiple rows have the same key, the first one is used.
+
+        The cells are moved (not copied) when rows are inserted,
+        so the rows in the index stay valid while the sheet is updated.
+        """
+        index = {}
+        rows = 0
+        for row in self.sheet.iter_rows():
+            index.setdefault(self.row_key(row), row)
+            rows += 1
+        sync_stats.count('rows scanned', rows)
+        return index
+
+    def hash_row(self, row_no, part):
+        """Hash the cells of a row that are synced with the part properties"""
+        values = [[prop, str(self.sheet.cell(row=row_no, column=self.col_lookup[prop]+1).value)]
+                  for prop in part if prop in self.col_lookup]
+        return hashlib.sha1(json.dumps(values).encode('utf-8')).hexdigest()
+
+    def sync(self, parts):
+        """Sync the parts to the sheet, see open(). Returns True if the
+        workbook changed."""
+        col_lookup = self.col_lookup
+
+        if not 'Sync' in col_lookup:
+            print("WARNING: xls file {} does not have a 'Sync' column."
+                    "This means you cannot detect obsolete entries...".format(self.name))
+
+        if self.row_index is None:
+            with sync_stats.phase('sheet indexing'):
+                self.row_index = self.index_rows()
+
+        self.new_sync_state = {}
+        self.last_updated_row = 1
+        self.new_rows = []
+        # Values (per column) of the queued new rows by key, and the changes
+        # of the parts with one of those keys that come after the first one
+        self.new_row_values = {}
+        self.new_row_updates = []
+        self.matched_rows = []
+        self.added_rows = set()
+        self.rows_in_state = self.sheet_state is self.sync_state
+
+        ## Output all of the component information
+        with sync_stats.phase('row matching'):
+            for part in parts:
+                self.update_row(part)
+
+        with sync_stats.phase('new rows'):
+            self.insert_new_rows(self.new_rows)
+
+            # The rest of the parts with the key of a new row update that row,
+            # as if it had been in the sheet already
+            for part, changes in self.new_row_updates:
+                self.update_new_row(part, changes)
+
+        ## XLS: mark the matched rows and style all obsolete entries
+        if 'Sync' in col_lookup:
+            with sync_stats.phase('obsolete styling'):
+                self.update_sync_column()
+
+        # The sheet in memory now matches the new sync state
+        self.sheet_state = self.new_sync_state
+        return self.workbook_changed
+
+    def update_sync_column(self):
+        """Set the Sync column of the matched rows to 1, and mark the other
+        rows with a value or footprint as obsolete. New rows were already
+        marked by write_new_row(). Only the cells that differ are written."""
+        sheet = self.sheet
+        col_lookup = self.col_lookup
+        col_no = col_lookup['Sync']+1
+        none = fills()['none']
+        obsolete = fills()['obsolete']
+
+        # Rows may have moved down since they were matched (see
+        # insert_new_rows()): their cells know where they are now
+        matched = set(row[0].row for row in self.matched_rows)
+
+        print("Styling obsolete entries")
+        for row_no in range(2, sheet.max_row + 1):
+            if row_no in self.added_rows:
+                continue
 
-                print("Obsolete component found with value='{}', "
-                        "footprint '{}':".format(val, fp))
+            cell = sheet.cell(column=col_no, row=row_no)
+            if row_no in matched:
+                value, fill = 1, none
+            else:
+                value, fill = None, none
+                val = sheet.cell(column=col_lookup['Value']+1, row=row_no).value
+                fp = sheet.cell(column=col_lookup['Footprint']+1, row=row_no).value
+                if val or fp:
+
+                    print("Obsolete component found with value='{}', "
+                            "footprint '{}':".format(val, fp))
+
+                    fill = obsolete
+
+            if cell.value != value:
+                cell.value = value
+                self.workbook_changed = True
+                sync_stats.count('cells written')
+            if cell.fill != fill:
+                cell.fill = fill
+                self.workbook_changed = True
+                sync_stats.count('cells written')
+        sync_stats.count('rows scanned', sheet.max_row - 1)
+
+    def update_row(self, part):
+        """Update the matching row of a part, or queue a new row for it"""
+        col_lookup = self.col_lookup
+
+        key = part_key(part)
+        row = self.row_index.get(key)
+        if row is not None:
+            row_no = row[0].row
+
+            xls_val = row[col_lookup['Value']].value
+            xls_fp = row[col_lookup['Footprint']].value
+
+            # Matching row found: it is marked as 'in sync' by update_sync_column()
+            self.matched_rows.append(row)
+
+            # Part and row did not change since the last sync: nothing to update.
+            # The row is only hashed if the sheet may have been edited since
+            # (A row that an earlier part with the same key already synced is
+            # always compared)
+            part_hash = hash_part(part)
+            synced = self.sync_state.get(key)
+            if (synced is not None and synced[0] == part_hash and
+                    not key in self.new_sync_state and
+                    (self.rows_in_state or synced[1] == self.hash_row(row_no, part))):
+                self.new_sync_state[key] = synced
+                self.last_updated_row = row_no
+                return
+
+            # Check each property agains the XLS value in the corresponding column
+            changes = part_changes(part, col_lookup, [cell.value for cell in row])
+            self.print_changes(xls_val, xls_fp, changes)
+            self.write_changes(row, changes)
+
+            self.new_sync_state[key] = (part_hash, self.hash_row(row_no, part))
+            self.last_updated_row = row_no
+            return
+
+        # A new row is already queued for this key (e.g. for a group with a
+        # value that only differs in white space): only one row is added.
+        # The changes are found (and printed) now, against the values of the
+        # queued row, and written once the row is inserted, see sync()
+        values = self.new_row_values.get(key)
+        if values is not None:
+            changes = part_changes(part, col_lookup, values)
+            self.print_changes(values[col_lookup['Value']],
+                               values[col_lookup['Footprint']], changes)
+            for prop, old_value, new_value in changes:
+                values[col_lookup[prop]] = new_value
+            self.new_row_updates.append((part, changes))
+            return
+
+        # No matching row was found: queue a new row right after the last updated
+        # row. All new rows are inserted at once, see insert_new_rows()
+        print("New component found with value='{}', "
+                "footprint '{}':".format(part['Value'], part['Footprint']))
+
+        values = [None] * (max(col_lookup.values()) + 1)
+        for prop, new_value in part_values(part, col_lookup):
+            values[col_lookup[prop]] = new_value
+        self.new_row_values[key] = values
+        self.new_rows.append((self.last_updated_row, part))
+
+    def print_changes(self, xls_val, xls_fp, changes):
+        """Print the changes of a row, see part_changes()"""
+        if changes:
+            print("Change(s) found for component with value='{}', "
+                    "footprint '{}':".format(xls_val, xls_fp))
+
+        for prop, old_value, new_value in changes:
+            print("'{}' changed from '{}' to '{}'".format(prop, old_value, new_value))
+
+            # This can only be because of changes in translation,
+            # otherwise this row would not have matched
+            if prop == 'Footprint':
+                print("Translated")
 
-                cell.fill = obsolete_fill
+    def write_changes(self, row, changes):
+        """Write the changes of a row (see part_changes()) and mark them"""
+        col_lookup = self.col_lookup
+        if changes:
+            self.workbook_changed = True
+            sync_stats.count('cells written', len(changes))
 
-xls.save(filename=xlsfile)
+        for prop, old_value, new_value in changes:
+            col_index = col_lookup[prop]
+            if prop == 'Footprint':
+                row[col_index].fill = fills()['translate']
+            else:
+                row[col_index].fill = fills()['changed']
+
+            row[col_index].value = new_value
+
+    def update_new_row(self, part, changes):
+        """Write the changes of a part to the new row with its key, see
+        update_row()"""
+        key = part_key(part)
+        row = self.row_index[key]
+        self.write_changes(row, changes)
+        self.new_sync_state[key] = (hash_part(part), self.hash_row(row[0].row, part))
+
+    def insert_new_rows(self, new_rows):
+        """Insert a row for each (anchor_row, part) in new_rows, directly below
+        the (original) anchor row. Parts with the same anchor keep their order.
+
+        Instead of inserting the rows one by one, which shifts all rows below
+        every time, each block of existing rows between two anchors is moved
+        down just once, starting from the bottom.
+        """
+        if not new_rows:
+            return
+        self.workbook_changed = True
+
+        from openpyxl.utils import get_column_letter
+
+        by_anchor = {}
+        for anchor, part in new_rows:
+            by_anchor.setdefault(anchor, []).append(part)
+        anchors = sorted(by_anchor)
+
+        max_row = self.sheet.max_row
+        last_col = get_column_letter(self.sheet.max_column)
+
+        offset = len(new_rows)
+        for i in reversed(range(len(anchors))):
+            anchor = anchors[i]
+            block_end = anchors[i+1] if i+1 < len(anchors) else max_row
+            if anchor < block_end:
+                self.sheet.move_range("A{}:{}{}".format(anchor+1, last_col, block_end), rows=offset)
+
+            parts = by_anchor[anchor]
+            offset -= len(parts)
+            for n, part in enumerate(parts):
+                self.write_new_row(anchor + offset + n + 1, part)
+
+    def write_new_row(self, row_no, part):
+        """Fill an empty row with the properties of a new part"""
+        col_lookup = self.col_lookup
+        for prop, new_value in part_values(part, col_lookup):
+            sync_stats.count('cells written')
+
+            # update property
+            cell = self.sheet.cell(row=row_no, column=col_lookup[prop]+1)
+            cell.fill = fills()['new']
+            cell.value = new_value
+
+            # Matching row found: mark it as 'in sync'
+            if 'Sync' in col_lookup:
+                cell = self.sheet.cell(row=row_no, column=col_lookup['Sync']+1)
+                cell.fill = fills()['new']
+                cell.value = 1
+
+        key = part_key(part)
+        self.new_sync_state[key] = (hash_part(part), self.hash_row(row_no, part))
+        self.row_index.setdefault(key, self.sheet[row_no])
+        self.added_rows.add(row_no)
+
+    def save(self, force=False):
+        """Save the workbook if it changed (or if forced), and the sync state
+        if it changed. Returns True if the workbook was saved."""
+        saved = False
+        if self.workbook_changed or force:
+            with sync_stats.phase('save'):
+                self.xls.save(filename=self.xlsfile)
+            saved = True
+        else:
+            print("BOM is already in sync: {} not saved".format(self.xlsfile))
+
+        if self.sync_state_file:
+            stamp = file_stamp(self.xlsfile)
+            if self.new_sync_state != self.sync_state or stamp != self.state_stamp:
+                save_sync_state(self.sync_state_file, self.new_sync_state, stamp)
+                self.state_stamp = stamp
+        self.sync_state = self.new_sync_state
+        self.workbook_changed = False
+        return saved
+
+
+def sync_bom(netlist, workbook_or_path, options=None):
+    """
+    Generate/update a BOM from a KiCad netlist, returns the exit code.
+
+    netlist is the file name of the netlist, or an already loaded
+    netlist_reader.netlist. workbook_or_path is the file name of the xlsx
+    file (with .xlsx), or an already loaded openpyxl workbook: that workbook
+    is synced (or checked) in memory, and is not saved.
+    """
+    if options is None:
+        options = SyncOptions()
+
+    if isinstance(netlist, netlist_reader.netlist):
+        net = netlist
+    else:
+        net = load_netlist(netlist, options.cache_dir)
+    parts = netlist_parts(net)
 
+    if isinstance(workbook_or_path, (str, os.PathLike)):
+        xlsfile, xls = os.fspath(workbook_or_path), None
+    else:
+        xlsfile, xls = None, workbook_or_path
+
+    if options.check:
+        with sync_stats.phase('check'):
+            return check_xls(parts, xlsfile, xls)
+
+    bom = bomSync(xlsfile, xls)
+    if not bom.open():
+        return 1
+    bom.sync(parts)
+    if xlsfile:
+        bom.save(options.force_save)
+    return 0
+
+
+# (namespace, name) -> original function, of the helpers wrapped by
+# count_hot_calls()
+_counted_calls = {}
+
+def _hot_calls():
+    """Return (namespace, name, counter) of each hot helper"""
+    calls = [(sys.modules[__name__], 'translate_fp', 'translate_fp calls'),
+             (netlist_reader, 'translate_fp', 'translate_fp calls')]
+    # The xml tree lookups: get() and the indexed accessors that replace it
+    for name in ('get', 'getChild', 'getChildren', 'getChildChars',
+                 'getChildAttribute', 'getFieldValue'):
+        calls.append((netlist_reader.xmlElement, name, 'xmlElement lookups'))
+    return calls
+
+def count_hot_calls():
+    """Count the calls of the hot helpers (for profiling): they are only
+    wrapped while profiling, so they do not cost anything otherwise.
+    uncount_hot_calls() removes the wrappers again."""
+    for namespace, name, counter in _hot_calls():
+        if (namespace, name) in _counted_calls:
+            continue
+        func = getattr(namespace, name)
+        _counted_calls[(namespace, name)] = func
+        setattr(namespace, name, sync_stats.count_calls(func, counter))
+
+def uncount_hot_calls():
+    """Restore the helpers wrapped by count_hot_calls()"""
+    for (namespace, name), func in _counted_calls.items():
+        setattr(namespace, name, func)
+    _counted_calls.clear()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+            description="Generate/update a XLSX BOM from a KiCad generic netlist",
+            epilog='Command line (from KiCad):\npython "pathToFile/BOM.py" "%I" "%O"',
+            formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('netlist', help="bom-from-KiCad.xml")
+    parser.add_argument('output', help="generated-bom-xlsx-file (without .xlsx)")
+    parser.add_argument('--cache-dir',
+            help="keep parsed netlists in this directory, so an unchanged netlist "
+                 "is not parsed again the next time")
+    parser.add_argument('--force-save', action='store_true',
+            help="save the xlsx file even if the BOM was already in sync")
+    parser.add_argument('--check', action='store_true',
+            help="only check if the xlsx file is in sync, without changing it. "
+                 "Exits with 1 if it is not")
+    parser.add_argument('--profile', action='store_true',
+            help="print the time spent in each phase of the sync, and counters")
+    parser.add_argument('--profile-json', metavar='FILE',
+            help="write the time spent in each phase of the sync, and counters, "
+                 "to a JSON file")
+    args = parser.parse_args(argv)
+
+    options = SyncOptions(cache_dir=args.cache_dir, force_save=args.force_save,
+                          check=args.check)
+
+    # Profiling: record the phases and counters, and report them when done
+    # (also when exiting early)
+    profile = args.profile or args.profile_json
+    if profile:
+        sync_stats.enable()
+        count_hot_calls()
+    try:
+        return sync_bom(args.netlist, args.output + '.xlsx', options)
+    finally:
+        if profile:
+            if args.profile:
+                print(sync_stats.report())
+            if args.profile_json:
+                sync_stats.save(args.profile_json)
+            sync_stats.disable()
+            uncount_hot_calls()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
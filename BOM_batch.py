@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+
+#
+# Generate/update the XLSX BOMs of many KiCad projects in parallel
+#
+
+"""
+    @package
+    Sync a list of KiCad generic netlists with their XLSX BOMs, in parallel.
+
+    The manifest lists one project per line: the netlist and the BOM file
+    (without .xlsx), separated by whitespace. Use quotes for paths with
+    spaces. Relative paths are relative to the manifest. Empty lines and
+    lines starting with # are ignored:
+
+        # netlist                 BOM
+        boards/main/main.xml      boards/main/main-bom
+        "boards/io board/io.xml"  "boards/io board/io-bom"
+
+    Each project is synced by BOM.main() in a pool of worker processes (one
+    per core by default). The worker processes are reused, so python and
+    openpyxl are only started once per worker instead of once per project.
+    The output of each project is printed as a whole when it is done.
+
+    Command line:
+    python "pathToFile/BOM_batch.py" manifest.txt
+    python "pathToFile/BOM_batch.py" --check manifest.txt
+"""
+
+import argparse
+import concurrent.futures
+import contextlib
+import io
+import os
+import shlex
+import sys
+import time
+import traceback
+
+import BOM
+
+
+def read_manifest(fname):
+    """Return a list of (netlist, output) pairs from a manifest file"""
+    base = os.path.dirname(os.path.abspath(fname))
+    projects = []
+    with open(fname) as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+
+            try:
+                fields = shlex.split(line)
+            except ValueError as e:
+                raise ValueError("{}:{}: {}".format(fname, line_no, e))
+            if len(fields) != 2:
+                raise ValueError("{}:{}: expected a netlist and a BOM file, got '{}'".format(
+                        fname, line_no, line))
+
+            netlist, output = (os.path.join(base, os.path.expanduser(p)) for p in fields)
+            projects.append((netlist, output))
+    return projects
+
+
+def sync_project(netlist, output, options):
+    """Sync one project with BOM.main() in this (worker) process.
+    Returns (exit code, output text, seconds)."""
+    start = time.perf_counter()
+    buf = io.StringIO()
+    exit_code = 0
+    try:
+        with contextlib.redirect_stdout(buf), contextlib.redirect_stderr(buf):
+            exit_code = BOM.main(options + [netlist, output]) or 0
+    except SystemExit as e:
+        if isinstance(e.code, int):
+            exit_code = e.code
+        elif e.code is not None:
+            buf.write("{}\n".format(e.code))
+            exit_code = 1
+    except Exception:
+        buf.write(traceback.format_exc())
+        exit_code = 1
+    return exit_code, buf.getvalue(), time.perf_counter() - start
+
+
+def sync_all(projects, options, jobs):
+    """Sync all projects with a pool of jobs worker processes. The output of
+    each project is printed once it is done. Returns a list of
+    (netlist, output, exit code, seconds), in manifest order."""
+    results = [None] * len(projects)
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = {pool.submit(sync_project, netlist, output, options): i
+                   for i, (netlist, output) in enumerate(projects)}
+        for future in concurrent.futures.as_completed(futures):
+            i = futures[future]
+            netlist, output = projects[i]
+            try:
+                exit_code, text, seconds = future.result()
+            except Exception as e:
+                # e.g. the worker process died
+                exit_code, text, seconds = 1, "ERROR: {}\n".format(e), 0.0
+
+            print("==== {} -> {}.xlsx".format(netlist, output))
+            sys.stdout.write(text)
+            sys.stdout.flush()
+            results[i] = (netlist, output, exit_code, seconds)
+    return results
+
+
+def print_summary(results):
+    failed = [r for r in results if r[2] != 0]
+    print("==== Summary")
+    for netlist, output, exit_code, seconds in results:
+        print("{:<6} {:7.2f} s  {}.xlsx".format("OK" if exit_code == 0 else "FAILED",
+                                                seconds, output))
+    print("{} projects, {} OK, {} failed".format(len(results), len(results) - len(failed), len(failed)))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+            description="Generate/update the XLSX BOMs of many KiCad projects in parallel")
+    parser.add_argument('manifest', help="file with a 'netlist BOM-file' pair per line")
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1,
+            help="number of worker processes (default: number of cores)")
+    parser.add_argument('--cache-dir',
+            help="keep parsed netlists in this directory, see BOM.py")
+    parser.add_argument('--force-save', action='store_true',
+            help="save the xlsx files even if the BOMs were already in sync")
+    parser.add_argument('--check', action='store_true',
+            help="only check if the xlsx files are in sync, without changing them. "
+                 "Exits with 1 if any is not")
+    args = parser.parse_args()
+
+    try:
+        projects = read_manifest(args.manifest)
+    except (OSError, ValueError) as e:
+        print("ERROR: {}".format(e))
+        sys.exit(2)
+
+    options = []
+    if args.cache_dir:
+        options += ['--cache-dir', os.path.abspath(args.cache_dir)]
+    if args.force_save:
+        options.append('--force-save')
+    if args.check:
+        options.append('--check')
+
+    results = sync_all(projects, options, max(1, min(args.jobs, len(projects) or 1)))
+    print_summary(results)
+    sys.exit(1 if any(r[2] != 0 for r in results) else 0)
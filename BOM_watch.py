@@ -0,0 +1,228 @@
+#!/usr/bin/env python
+
+#
+# Keep a XLSX BOM in sync with a KiCad generic netlist while it changes
+#
+
+"""
+    @package
+    Watch a KiCad generic netlist, and sync the XLSX BOM every time the
+    netlist changes (e.g. when the BOM is generated again from KiCad).
+
+    The workbook and its row index are kept in memory between syncs, so
+    only the netlist is parsed again. Rows of groups that did not change are
+    skipped (see the incremental sync of BOM.py), and the workbook is saved
+    in the background: the next change is already parsed while it is saved.
+
+    If the xlsx file is changed by someone else (e.g. saved from a
+    spreadsheet application), it is loaded again before the next sync, so
+    those edits are not overwritten. Close the BOM in the spreadsheet
+    application before the netlist changes though, as it may overwrite
+    the synced BOM when it is saved.
+
+    The netlist is watched with inotify if the inotify_simple package is
+    installed (Linux), and by polling its size and modification time
+    otherwise.
+
+    Command line:
+    python "pathToFile/BOM_watch.py" "%I" "%O"
+    python "pathToFile/BOM_watch.py" --interval 0.5 "%I" "%O"
+"""
+
+import argparse
+import os
+import sys
+import threading
+import time
+import traceback
+
+import BOM
+
+try:
+    import inotify_simple
+except ImportError:
+    inotify_simple = None
+
+
+class pollWatcher:
+    """Wait for a file to change by polling its size and modification time"""
+    def __init__(self, fname, interval):
+        self.fname = fname
+        self.interval = interval
+        self.stamp = BOM.file_stamp(fname)
+
+    def wait(self):
+        """Block until the file changed"""
+        while True:
+            time.sleep(self.interval)
+            stamp = BOM.file_stamp(self.fname)
+            if stamp != self.stamp:
+                self.stamp = stamp
+                return
+
+    def close(self):
+        pass
+
+
+class inotifyWatcher:
+    """Wait for a file to change with inotify. The directory is watched, as
+    the file may be replaced instead of written."""
+    def __init__(self, fname):
+        self.fname = os.path.basename(fname)
+        self.inotify = inotify_simple.INotify()
+        flags = inotify_simple.flags
+        self.inotify.add_watch(os.path.dirname(os.path.abspath(fname)),
+                               flags.CLOSE_WRITE | flags.MOVED_TO | flags.CREATE)
+
+    def wait(self):
+        """Block until the file changed"""
+        while True:
+            for event in self.inotify.read():
+                if event.name == self.fname:
+                    return
+
+    def close(self):
+        self.inotify.close()
+
+
+class bomWatch:
+    """
+    Sync a BOM with a netlist every time the netlist changes, keeping the
+    workbook in memory (see BOM.bomSync).
+    """
+    def __init__(self, netlist, xlsfile, options, interval=0.2, settle=0.1):
+        self.netlist = netlist
+        self.xlsfile = xlsfile
+        self.options = options
+        self.interval = interval
+        self.settle = settle
+
+        self.bom = None
+        # (size, mtime) of the xlsx file when it was loaded or last saved
+        self.xls_stamp = None
+        self.save_thread = None
+        self.save_error = None
+
+    def open_bom(self):
+        """(Re)load the workbook"""
+        self.bom = BOM.bomSync(self.xlsfile)
+        if not self.bom.open():
+            self.bom = None
+            return False
+        self.xls_stamp = BOM.file_stamp(self.xlsfile)
+        return True
+
+    def wait_for_save(self):
+        """Wait until the background save is done"""
+        if self.save_thread is not None:
+            self.save_thread.join()
+            self.save_thread = None
+            if self.save_error:
+                print("ERROR: could not save {}: {}".format(self.xlsfile, self.save_error))
+                # The file on disk is not what is in memory: load it again
+                self.bom = None
+                self.save_error = None
+
+    def save(self, sync_state):
+        """Save the workbook and the sync state. The workbook is written to a
+        temporary file first, so the xlsx file is never half written."""
+        tmp = "{}.{}.tmp".format(self.xlsfile, os.getpid())
+        try:
+            self.bom.xls.save(filename=tmp)
+            os.replace(tmp, self.xlsfile)
+            self.xls_stamp = BOM.file_stamp(self.xlsfile)
+            if self.bom.sync_state_file:
+                BOM.save_sync_state(self.bom.sync_state_file, sync_state, self.xls_stamp)
+        except Exception as e:
+            self.save_error = e
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+
+    def sync(self):
+        """Parse the netlist and sync it to the workbook in memory, then save
+        the workbook in the background if it changed"""
+        start = time.perf_counter()
+        net = BOM.load_netlist(self.netlist, self.options.cache_dir)
+        parts = BOM.netlist_parts(net)
+
+        # The workbook must not change while it is being saved
+        self.wait_for_save()
+
+        if self.bom is not None and BOM.file_stamp(self.xlsfile) != self.xls_stamp:
+            print("{} was changed, loading it again".format(self.xlsfile))
+            self.bom = None
+        if self.bom is None and not self.open_bom():
+            return
+
+        bom = self.bom
+        bom.sync(parts)
+        if bom.workbook_changed or self.options.force_save:
+            sync_state = bom.new_sync_state
+            self.save_thread = threading.Thread(target=self.save, args=(sync_state,))
+            self.save_thread.start()
+        else:
+            print("BOM is already in sync: {} not saved".format(self.xlsfile))
+        bom.sync_state = bom.new_sync_state
+        bom.workbook_changed = False
+
+        print("Synced {} in {:.2f} s".format(self.netlist, time.perf_counter() - start))
+
+    def sync_guarded(self):
+        """sync(), but a broken netlist (e.g. while it is being written)
+        does not stop watching"""
+        try:
+            self.sync()
+        except (Exception, SystemExit):
+            traceback.print_exc()
+            print("ERROR: could not sync {}, waiting for the next change".format(self.netlist))
+        sys.stdout.flush()
+
+    def run(self):
+        if inotify_simple is not None:
+            watcher = inotifyWatcher(self.netlist)
+        else:
+            watcher = pollWatcher(self.netlist, self.interval)
+
+        try:
+            self.sync_guarded()
+            while True:
+                print("Watching {} for changes (Ctrl+C to stop)".format(self.netlist))
+                sys.stdout.flush()
+                watcher.wait()
+
+                # Wait until the netlist is completely written
+                stamp = BOM.file_stamp(self.netlist)
+                while True:
+                    time.sleep(self.settle)
+                    new_stamp = BOM.file_stamp(self.netlist)
+                    if new_stamp == stamp:
+                        break
+                    stamp = new_stamp
+                if stamp is None:
+                    continue
+
+                self.sync_guarded()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            watcher.close()
+            self.wait_for_save()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+            description="Keep a XLSX BOM in sync with a KiCad generic netlist while it changes")
+    parser.add_argument('netlist', help="bom-from-KiCad.xml")
+    parser.add_argument('output', help="generated-bom-xlsx-file (without .xlsx)")
+    parser.add_argument('--cache-dir',
+            help="keep parsed netlists in this directory, see BOM.py")
+    parser.add_argument('--force-save', action='store_true',
+            help="save the xlsx file after every sync, even if the BOM was already in sync")
+    parser.add_argument('--interval', type=float, default=0.2,
+            help="seconds between checks of the netlist when polling (default: 0.2)")
+    args = parser.parse_args()
+
+    options = BOM.SyncOptions(cache_dir=args.cache_dir, force_save=args.force_save)
+    bomWatch(args.netlist, args.output + '.xlsx', options, interval=args.interval).run()
@@ -0,0 +1,247 @@
+#!/usr/bin/env python
+
+#
+# Benchmark the netlist reader and the BOM sync on synthetic designs
+#
+
+"""
+    @package
+    Time the phases of a BOM generation on synthetic netlists of different
+    sizes (see generate.py), and report their peak memory use:
+
+    netlist phases (in this process):
+        load_sax, load_etree -- netlist.load() with each parser backend
+        load_skip            -- netlist.load() without nets and libraries
+        load_cached          -- netlist.load() from a warm cache directory
+        interesting          -- netlist.getInterestingComponents()
+        group                -- netlist.groupComponents()
+
+    BOM sync scenarios (BOM.sync_bom(), like BOM.py):
+        sync_create -- create a new BOM
+        sync_update -- sync with a pre-filled BOM of an earlier revision
+        sync_noop   -- sync again, when the BOM is already in sync
+        check       -- BOM.py --check
+
+    Each sync scenario is timed as a whole, and its phases (parsing,
+    libpart linking, grouping, sheet indexing, row matching, obsolete
+    styling, saving, ...) are timed separately with sync_stats.
+
+    Peak memory is measured with tracemalloc, in a separate run so it does
+    not affect the timings.
+
+    The results are saved as JSON, so runs can be compared:
+    python benchmarks/bench.py --sizes 1000,10000
+    python benchmarks/bench.py --compare benchmarks/results/<earlier run>.json
+"""
+
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, REPO_DIR)
+
+import BOM
+import netlist_reader
+import sync_stats
+import generate
+
+
+def best_time(fn, repeat):
+    """Run fn() repeat times, return the fastest wall time in seconds"""
+    best = None
+    for i in range(repeat):
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def peak_memory(fn):
+    """Run fn() once, return the peak traced memory in MB"""
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1] / 1e6
+    finally:
+        tracemalloc.stop()
+
+
+def run_sync(netlist, output, options, repeat, prepare=None):
+    """Sync a netlist to output + '.xlsx' with BOM.sync_bom() repeat times.
+    prepare() is called before each run (outside the timing). Returns (best
+    wall time, phase name -> seconds of the fastest run)."""
+    best = None
+    for i in range(repeat):
+        if prepare:
+            prepare()
+        sync_stats.enable()
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                start = time.perf_counter()
+                BOM.sync_bom(netlist, output + '.xlsx', options)
+                elapsed = time.perf_counter() - start
+            phases = {p['name']: p['seconds'] for p in sync_stats.results()['phases']}
+        finally:
+            sync_stats.disable()
+
+        if best is None or elapsed < best[0]:
+            best = (elapsed, phases)
+    return best
+
+
+def bench_size(count, workdir, repeat):
+    """Run all phases for a design of count components, returns a dict of
+    phase -> {'time': seconds, 'peak_mb': MB}"""
+    results = {}
+    netlist = os.path.join(workdir, 'bench_{}.xml'.format(count))
+    prefilled = os.path.join(workdir, 'bench_{}_prefilled'.format(count))
+    output = os.path.join(workdir, 'bench_{}_bom'.format(count))
+    cache_dir = os.path.join(workdir, 'cache')
+
+    print("== {} components: generating netlist and workbook".format(count))
+    generate.generate_netlist(netlist, count)
+    generate.generate_workbook(prefilled, count, workdir=workdir)
+
+    def phase(name, fn):
+        results[name] = {'time': best_time(fn, repeat), 'peak_mb': peak_memory(fn)}
+        print("{:>14}: {:8.3f} s {:8.1f} MB".format(name, results[name]['time'], results[name]['peak_mb']))
+
+    # Netlist reader phases
+    phase('load_sax', lambda: netlist_reader.netlist(netlist, backend='sax'))
+    phase('load_etree', lambda: netlist_reader.netlist(netlist, backend='etree'))
+    phase('load_skip', lambda: netlist_reader.netlist(netlist, skip=('nets', 'libraries')))
+
+    shutil.rmtree(cache_dir, ignore_errors=True)
+    netlist_reader.netlist(netlist, cacheDir=cache_dir)
+    phase('load_cached', lambda: netlist_reader.netlist(netlist, cacheDir=cache_dir))
+
+    net = netlist_reader.netlist(netlist)
+    phase('interesting', lambda: net.getInterestingComponents())
+    phase('group', lambda: net.groupComponents())
+
+    # BOM sync scenarios
+    def sync_phase(name, options, prepare=None):
+        elapsed, phases = run_sync(netlist, output, options, repeat, prepare)
+        if prepare:
+            prepare()
+        with contextlib.redirect_stdout(io.StringIO()):
+            peak_mb = peak_memory(lambda: BOM.sync_bom(netlist, output + '.xlsx', options))
+        results[name] = {'time': elapsed, 'peak_mb': peak_mb, 'phases': phases}
+        print("{:>14}: {:8.3f} s {:8.1f} MB".format(name, elapsed, peak_mb))
+        for phase_name, seconds in phases.items():
+            print("{:>30}: {:8.3f} s".format(phase_name, seconds))
+
+    def remove_output():
+        for f in (output + '.xlsx', os.path.join(workdir, '.' + os.path.basename(output) + '.xlsx.sync')):
+            if os.path.exists(f):
+                os.remove(f)
+
+    def copy_prefilled():
+        remove_output()
+        shutil.copy(prefilled + '.xlsx', output + '.xlsx')
+
+    def sync_once():
+        # The first sync after new rows still restyles the Sync column
+        with contextlib.redirect_stdout(io.StringIO()):
+            BOM.sync_bom(netlist, output + '.xlsx')
+
+    sync_phase('sync_create', BOM.SyncOptions(), remove_output)
+    sync_phase('sync_update', BOM.SyncOptions(), copy_prefilled)
+    sync_phase('sync_noop', BOM.SyncOptions(), sync_once)
+    sync_phase('check', BOM.SyncOptions(check=True))
+
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR,
+                                       stderr=subprocess.DEVNULL, universal_newlines=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline):
+    """Print the ratio of each phase time against a baseline run"""
+    print("== compared with {} ({})".format(baseline['meta'].get('date'), baseline['meta'].get('commit')))
+    for size, phases in results['results'].items():
+        base_phases = baseline['results'].get(size)
+        if not base_phases:
+            continue
+        print("-- {} components".format(size))
+        for name, result in phases.items():
+            base = base_phases.get(name)
+            if not base or not base['time']:
+                continue
+            print("{:>14}: {:8.3f} s -> {:8.3f} s ({:5.2f}x), {:8.1f} MB -> {:8.1f} MB".format(
+                    name, base['time'], result['time'], base['time'] / result['time'],
+                    base['peak_mb'], result['peak_mb']))
+
+            base_sync_phases = base.get('phases', {})
+            for phase_name, seconds in result.get('phases', {}).items():
+                base_seconds = base_sync_phases.get(phase_name)
+                if base_seconds and seconds:
+                    print("{:>30}: {:8.3f} s -> {:8.3f} s ({:5.2f}x)".format(
+                            phase_name, base_seconds, seconds, base_seconds / seconds))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark netlist loading and BOM syncing")
+    parser.add_argument('--sizes', default='1000,10000',
+            help="comma separated component counts (default: 1000,10000)")
+    parser.add_argument('--repeat', type=int, default=3,
+            help="number of runs per phase, the fastest counts (default: 3)")
+    parser.add_argument('--output',
+            help="JSON file for the results (default: benchmarks/results/<date>-<commit>.json)")
+    parser.add_argument('--compare', help="JSON results of an earlier run to compare with")
+    parser.add_argument('--workdir', help="directory for the generated files (default: a temporary directory)")
+    args = parser.parse_args()
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix='kicad_bom_bench_')
+    os.makedirs(workdir, exist_ok=True)
+
+    commit = git_commit()
+    results = {
+        'meta': {
+            'date': datetime.datetime.now().isoformat(timespec='seconds'),
+            'commit': commit,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'repeat': args.repeat,
+        },
+        'results': {},
+    }
+
+    try:
+        for size in args.sizes.split(','):
+            results['results'][size] = bench_size(int(size), workdir, args.repeat)
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    output = args.output
+    if not output:
+        name = '{}-{}.json'.format(datetime.datetime.now().strftime('%Y%m%d-%H%M%S'), commit or 'unknown')
+        output = os.path.join(BENCH_DIR, 'results', name)
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print("Results saved to {}".format(output))
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
@@ -0,0 +1,302 @@
+#!/usr/bin/env python
+
+#
+# Generate synthetic KiCad generic netlists (and matching BOM workbooks)
+# for benchmarking
+#
+
+"""
+    @package
+    Generate a synthetic KiCad generic netlist with a realistic mix of
+    components: mostly resistors and capacitors with E-series values, some
+    ICs, connectors, LEDs, test points and mounting holes. Like in a real
+    design, most ICs have a library part (and value) of their own: there are
+    about count / 10 of those unique parts. The netlist has libparts,
+    libraries and nets (with a node for every pin).
+
+    A matching, pre-filled BOM workbook is made by syncing an earlier
+    'revision' of the same design (some values changed, some parts added or
+    removed) with BOM.py.
+
+    Command line:
+    python benchmarks/generate.py 10000 netlist.xml
+    python benchmarks/generate.py --workbook bom 10000 netlist.xml
+    python benchmarks/generate.py --unique-parts 5000 10000 netlist.xml
+"""
+
+import argparse
+import os
+import random
+import subprocess
+import sys
+from xml.sax.saxutils import quoteattr, escape
+
+BOM_SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'BOM.py')
+
+E12 = [10, 12, 15, 18, 22, 27, 33, 39, 47, 56, 68, 82]
+
+def _resistor_values():
+    values = []
+    for suffix, decades in [('R', [1, 10, 100]), ('k', [1, 10, 100]), ('M', [1])]:
+        for decade in decades:
+            for e in E12:
+                values.append('{:g}{}'.format(e * decade / 10, suffix))
+    return values
+
+def _capacitor_values():
+    values = []
+    for suffix, decades in [('pF', [1, 10, 100]), ('nF', [1, 10, 100]), ('uF', [1, 10])]:
+        for decade in decades:
+            for e in (10, 22, 47):
+                v = e * decade / 10
+                values.append('{:g}{}'.format(v, suffix))
+    return values
+
+# Component kinds: (ref prefix, weight, library part, pin count, values, footprints)
+KINDS = [
+    ('R', 40, 'R', 2, _resistor_values(),
+        ['Resistor_SMD:R_0402_1005Metric', 'Resistor_SMD:R_0603_1608Metric', 'Resistor_SMD:R_0805_2012Metric']),
+    ('C', 35, 'C', 2, _capacitor_values(),
+        ['Capacitor_SMD:C_0402_1005Metric', 'Capacitor_SMD:C_0603_1608Metric', 'Capacitor_SMD:C_1206_3216Metric']),
+    ('L', 3, 'L', 2, ['1uH', '2.2uH', '10uH', '47uH'],
+        ['Inductor_SMD:L_0805_2012Metric', 'Inductor_SMD:L_Bourns_SRR1260']),
+    ('D', 5, 'LED', 2, ['LED', 'BAT54', '1N4148', 'SMBJ5.0A'],
+        ['LED_SMD:LED_0603_1608Metric', 'Diode_SMD:D_SOD-123', 'Diode_SMD:D_SMB']),
+    ('U', 8, 'IC', 16, ['STM32F405RGT6', 'LM358', 'TPS62130', 'SN74LVC1G08', 'ADS1115', 'MAX3232'],
+        ['Package_QFP:LQFP-64_10x10mm_P0.5mm', 'Package_SO:SOIC-8_3.9x4.9mm_P1.27mm',
+         'Package_DFN_QFN:QFN-16-1EP_3x3mm_P0.5mm', 'Package_TO_SOT_SMD:SOT-23-5']),
+    ('J', 3, 'Conn', 6, ['USB_C', 'Conn_01x04', 'Conn_02x05', 'Barrel_Jack'],
+        ['Connector_USB:USB_C_Receptacle_GCT_USB4085', 'Connector_PinHeader_2.54mm:PinHeader_1x04_P2.54mm_Vertical']),
+    ('Q', 2, 'Q', 3, ['BSS138', 'AO3401', 'MMBT3904'],
+        ['Package_TO_SOT_SMD:SOT-23']),
+    ('Y', 1, 'Crystal', 2, ['8MHz', '32.768kHz', '25MHz'],
+        ['Crystal:Crystal_SMD_3225-4Pin_3.2x2.5mm']),
+    ('TP', 2, 'TestPoint', 1, ['TP'],
+        ['TestPoint:TestPoint_Pad_D1.0mm']),
+    ('H', 1, 'MountingHole', 1, ['MountingHole'],
+        ['MountingHole:MountingHole_3.2mm_M3']),
+]
+
+MANUFACTURERS = ['Yageo', 'Murata', 'TDK', 'Samsung', 'Vishay', 'TI', 'ST']
+
+
+def default_unique_parts(count):
+    """Number of unique IC library parts in a design of count components"""
+    return max(1, count // 10)
+
+
+def generate_components(count, seed=1, revision=0, unique_parts=None):
+    """Return a list of component dicts. Different revisions of the same seed
+    share most components, like two revisions of a real design. The ICs use
+    unique_parts different library parts (see default_unique_parts())."""
+    if unique_parts is None:
+        unique_parts = default_unique_parts(count)
+    rnd = random.Random(seed)
+    rev = random.Random(seed * 1000 + revision)
+    weights = [k[1] for k in KINDS]
+
+    # Designs use a limited set of distinct values per kind
+    used_values = {}
+    for prefix, weight, part, pins, values, footprints in KINDS:
+        n = max(1, min(len(values), 3 + count // 2000))
+        used_values[prefix] = rnd.sample(values, n)
+
+    counters = {}
+    components = []
+    for i in range(count):
+        prefix, weight, part, pins, values, footprints = rnd.choices(KINDS, weights)[0]
+        counters[prefix] = counters.get(prefix, 0) + 1
+        ref = '{}{}'.format(prefix, counters[prefix])
+
+        # Skewed distribution: a few values are used a lot (e.g. 100nF)
+        candidates = used_values[prefix]
+        value = candidates[min(int(rnd.expovariate(1.0)), len(candidates) - 1)]
+        footprint = footprints[min(int(rnd.expovariate(1.5)), len(footprints) - 1)]
+
+        fields = {}
+        if rnd.random() < 0.4:
+            fields['MPN'] = '{}-{}-{}'.format(prefix, value, footprint.split(':')[-1][:8])
+            fields['Manufacturer'] = rnd.choice(MANUFACTURERS)
+        if prefix in ('C', 'R') and rnd.random() < 0.2:
+            fields['Rating'] = rnd.choice(['16V', '25V', '50V', '1%', '0.1W'])
+        if rnd.random() < 0.02:
+            fields['DNI'] = '1'
+
+        component = {
+            'ref': ref, 'value': value, 'footprint': footprint, 'part': part,
+            'pins': pins if pins != 16 else rnd.choice([5, 8, 16, 64]),
+            'fields': fields, 'tstamp': '{:08X}'.format(rnd.getrandbits(32)),
+            'dnp': rnd.random() < 0.01,
+        }
+
+        # ICs: a library part of their own, with its name as value
+        if part == 'IC' and unique_parts:
+            n = rnd.randrange(unique_parts)
+            component['part'] = component['value'] = 'IC{}'.format(n)
+            component['pins'] = (5, 8, 16, 64)[n % 4]
+
+        # Later revisions: some parts change value, some are removed or added.
+        # (rev is a separate random generator, so all revisions of a seed
+        # draw the same numbers from rnd)
+        if revision and rev.random() < 0.03:
+            component['value'] = rev.choice(values)
+        if revision and rev.random() < 0.01:
+            continue
+
+        components.append(component)
+
+    for i in range(revision * count // 100):
+        counters['R'] = counters.get('R', 0) + 1
+        components.append({
+            'ref': 'R{}'.format(counters['R']), 'value': rev.choice(KINDS[0][4]),
+            'footprint': KINDS[0][5][0], 'part': 'R', 'pins': 2, 'fields': {},
+            'tstamp': '{:08X}'.format(rev.getrandbits(32)), 'dnp': False,
+        })
+
+    return components
+
+
+def write_netlist(f, components, nets_per_component=1.5, seed=1):
+    """Write a KiCad (version E) generic netlist for the components to file f"""
+    rnd = random.Random(seed)
+    w = f.write
+
+    w('<?xml version="1.0" encoding="UTF-8"?>\n')
+    w('<export version="E">\n')
+    w('  <design>\n')
+    w('    <source>/home/user/bench/bench.kicad_sch</source>\n')
+    w('    <date>2024-01-01T12:00:00+0100</date>\n')
+    w('    <tool>Eeschema 7.0.10</tool>\n')
+    w('    <sheet number="1" name="/" tstamps="/">\n')
+    w('      <title_block>\n')
+    w('        <title>Benchmark</title>\n')
+    w('        <company/>\n')
+    w('        <rev>1</rev>\n')
+    w('      </title_block>\n')
+    w('    </sheet>\n')
+    w('  </design>\n')
+
+    w('  <components>\n')
+    for c in components:
+        w('    <comp ref={}>\n'.format(quoteattr(c['ref'])))
+        w('      <value>{}</value>\n'.format(escape(c['value'])))
+        w('      <footprint>{}</footprint>\n'.format(escape(c['footprint'])))
+        w('      <datasheet>~</datasheet>\n')
+        if c['fields']:
+            w('      <fields>\n')
+            for name, value in c['fields'].items():
+                w('        <field name={}>{}</field>\n'.format(quoteattr(name), escape(value)))
+            w('      </fields>\n')
+        w('      <libsource lib="Device" part={} description={}/>\n'.format(
+                quoteattr(c['part']), quoteattr(c['part'] + ' part')))
+        w('      <property name="Sheetname" value=""/>\n')
+        w('      <property name="Sheetfile" value="bench.kicad_sch"/>\n')
+        if c['dnp']:
+            w('      <property name="dnp"/>\n')
+        w('      <sheetpath names="/" tstamps="/"/>\n')
+        w('      <tstamps>{}</tstamps>\n'.format(c['tstamp']))
+        w('    </comp>\n')
+    w('  </components>\n')
+
+    # A libpart per library part of the kinds and of the unique ICs
+    libparts = {}
+    for prefix, weight, part, pins, values, footprints in KINDS:
+        libparts[part] = (prefix, pins, footprints)
+    for c in components:
+        if not c['part'] in libparts:
+            libparts[c['part']] = ('U', c['pins'], [c['footprint']])
+
+    w('  <libparts>\n')
+    for part, (prefix, pins, footprints) in libparts.items():
+        w('    <libpart lib="Device" part={}>\n'.format(quoteattr(part)))
+        w('      <description>{} part</description>\n'.format(escape(part)))
+        w('      <docs>~</docs>\n')
+        w('      <footprints>\n')
+        w('        <fp>{}</fp>\n'.format(escape(footprints[0].split(':')[-1].split('_')[0] + '_*')))
+        w('      </footprints>\n')
+        w('      <fields>\n')
+        w('        <field name="Reference">{}</field>\n'.format(escape(prefix)))
+        w('        <field name="Value">{}</field>\n'.format(escape(part)))
+        w('        <field name="Footprint">{}</field>\n'.format(escape(footprints[0])))
+        w('        <field name="Datasheet">~</field>\n')
+        w('      </fields>\n')
+        w('      <pins>\n')
+        for pin in range(1, min(pins, 64) + 1):
+            w('        <pin num="{}" name="~" type="passive"/>\n'.format(pin))
+        w('      </pins>\n')
+        w('    </libpart>\n')
+    w('  </libparts>\n')
+
+    w('  <libraries>\n')
+    w('    <library logical="Device">\n')
+    w('      <uri>/usr/share/kicad/symbols/Device.kicad_sym</uri>\n')
+    w('    </library>\n')
+    w('  </libraries>\n')
+
+    # Connect every pin to a net: a few big nets (GND, power) and many
+    # small signal nets
+    nets = {}
+    net_count = max(4, int(len(components) * nets_per_component / 2))
+    for c in components:
+        for pin in range(1, c['pins'] + 1):
+            r = rnd.random()
+            if r < 0.25:
+                name = 'GND'
+            elif r < 0.35:
+                name = '+3V3'
+            else:
+                name = 'Net-{}'.format(rnd.randrange(net_count))
+            nets.setdefault(name, []).append((c['ref'], str(pin)))
+
+    w('  <nets>\n')
+    for code, (name, nodes) in enumerate(sorted(nets.items()), 1):
+        w('    <net code="{}" name={} class="Default">\n'.format(code, quoteattr(name)))
+        for ref, pin in nodes:
+            w('      <node ref={} pin="{}" pintype="passive"/>\n'.format(quoteattr(ref), pin))
+        w('    </net>\n')
+    w('  </nets>\n')
+    w('</export>\n')
+
+
+def generate_netlist(fname, count, seed=1, revision=0, unique_parts=None):
+    """Write a synthetic netlist with about count components to fname"""
+    components = generate_components(count, seed, revision, unique_parts)
+    with open(fname, 'w', encoding='utf-8') as f:
+        write_netlist(f, components, seed=seed)
+    return fname
+
+
+def generate_workbook(output, count, seed=1, workdir=None, unique_parts=None):
+    """Create a pre-filled BOM workbook output + '.xlsx' that matches the
+    design of generate_netlist(count, seed, unique_parts=unique_parts): it
+    is synced from an earlier revision of the design, so syncing the current
+    revision finds new, changed and obsolete lines.
+    """
+    workdir = workdir or os.path.dirname(os.path.abspath(output))
+    os.makedirs(workdir, exist_ok=True)
+    previous = os.path.join(workdir, 'bench_{}_previous.xml'.format(count))
+    generate_netlist(previous, count, seed, revision=1, unique_parts=unique_parts)
+
+    if os.path.exists(output + '.xlsx'):
+        os.remove(output + '.xlsx')
+    subprocess.run([sys.executable, BOM_SCRIPT, previous, output],
+                   check=True, stdout=subprocess.DEVNULL)
+    return output + '.xlsx'
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Generate a synthetic KiCad generic netlist")
+    parser.add_argument('count', type=int, help="number of components")
+    parser.add_argument('netlist', help="netlist file to write")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--revision', type=int, default=0,
+            help="design revision: revisions of the same seed differ slightly")
+    parser.add_argument('--unique-parts', type=int,
+            help="number of different IC library parts (default: count / 10)")
+    parser.add_argument('--workbook',
+            help="also write a matching pre-filled BOM workbook (without .xlsx)")
+    args = parser.parse_args()
+
+    generate_netlist(args.netlist, args.count, args.seed, args.revision, args.unique_parts)
+    if args.workbook:
+        generate_workbook(args.workbook, args.count, args.seed, unique_parts=args.unique_parts)
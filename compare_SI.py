@@ -1,37 +1,40 @@
+
 import re
+from functools import lru_cache
 numeric_regex = re.compile('(^[0-9.]+)\s*([^0-9]?)')
 
+SI_multipliers = {
+        'y': 1e-24,
+        'z': 1e-21,
+        'a': 1e-18,
+        'f': 1e-15,
+        'p': 1e-12,
+        'n': 1e-9,
+        'µ': 1e-6,
+        'u': 1e-6,
+        'm': 1e-3,
+        'c': 1e-2,
+        'd': 1e-1,
+        'h': 1e2,
+        'k': 1e3,
+        'K': 1e3,
+        'M': 1e6,
+        'G': 1e9,
+        'T': 1e12,
+        'P': 1e15,
+        'E': 1e18,
+        'Z': 1e21,
+        'Y': 1e24,
+        }
 
-def _to_numeric(SI_str):
 
-    SI_multipliers = {
-            'y': 1e-24,
-            'z': 1e-21,
-            'a': 1e-18,
-            'f': 1e-15,
-            'p': 1e-12,
-            'n': 1e-9,
-            'µ': 1e-6,
-            'u': 1e-6,
-            'm': 1e-3,
-            'c': 1e-2,
-            'd': 1e-1,
-            'h': 1e2,
-            'k': 1e3,
-            'K': 1e3,
-            'M': 1e6,
-            'G': 1e9,
-            'T': 1e12,
-            'P': 1e15,
-            'E': 1e18,
-            'Z': 1e21,
-            'Y': 1e24,
-            }
+@lru_cache(maxsize=4096)
+def _to_numeric(SI_str):
 
     match = numeric_regex.match(SI_str)
     if not match:
         return None
-    
+
     num = match.group(1)
     suffix = match.group(2)
     if suffix in SI_multipliers:
@@ -39,7 +42,31 @@ def _to_numeric(SI_str):
     else:
         mult = 1
 
-    return (float(num) * mult)
+    try:
+        return (float(num) * mult)
+    except ValueError:
+        # e.g. '1.2.3'
+        return None
+
+
+def SI_key(SI_str):
+    """
+    Sort key for SI-suffixed values: values that parse as a number sort
+    numerically (18pF before 4nF). Other values fall back to default string
+    sorting (alphabetical order), and sort around the numbers the way
+    compare_SI() compares a number with text as strings: text that starts
+    with a character before '0' (e.g. '+5V', '(NC)') comes before the
+    numbers, all other text after them.
+
+    The parse result is cached, so computing the key for a value that
+    was seen before is a lookup.
+    """
+    num = _to_numeric(SI_str)
+    if num is not None:
+        return (1, num, '')
+    if SI_str[:1] < '0':
+        return (0, 0, SI_str)
+    return (2, 0, SI_str)
 
 
 def compare_SI(a,b):
@@ -61,5 +88,3 @@ def compare_SI(a,b):
     #print("Fallback: {} < {}".format(a,b), result)
 
     return -1 if result else 1
-
-
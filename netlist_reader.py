@@ -18,12 +18,30 @@
 from __future__ import print_function
 import sys
 import xml.sax as sax
+import xml.sax.saxutils as saxutils
+import xml.etree.ElementTree as ElementTree
 import re
-import pdb
+import os
+import hashlib
+import pickle
+import gc
+import functools
+from array import array
+from collections import namedtuple
+from types import MappingProxyType
 
 from translate_fp import translate_fp
-from compare_SI import compare_SI
-from functools import cmp_to_key
+from compare_SI import SI_key
+import sync_stats
+
+try:
+    import lxml.etree as _lxml_etree
+except ImportError:
+    _lxml_etree = None
+
+# Version of the netlist cache snapshots: increase it whenever the classes
+# below change in a way that makes old snapshots unusable
+CACHE_VERSION = 4
 
 
 #-----<Configure>----------------------------------------------------------------
@@ -71,20 +89,67 @@ excluded_footprints = [
     #'MOUNTHOLE'
     ]
 
+
+# Maximum total size in bytes of the snapshots in a netlist cache directory
+# (see netlist.load()). When it is exceeded, the least recently used snapshots
+# are removed.
+cache_max_bytes = 256 * 1024 * 1024
+
 #-----</Configure>---------------------------------------------------------------
 
 
+# Shared, read-only empty attributes/index of an xmlElement (see xmlElement)
+_noItems = MappingProxyType({})
+
 class xmlElement():
     """xml element which can represent all nodes of the netlist tree.  It can be
     used to easily generate various output formats by propogating format
     requests to children recursively.
+
+    While the tree is built, each element indexes its children by name, and a
+    'fields' element also indexes the values of its 'field' children by field
+    name. The component and libpart accessors use these indices instead of
+    searching the tree.
+
+    A netlist has a lot of elements, most of them without attributes or
+    children: elements have no __dict__, and the containers are only
+    allocated when the first item is added. Until then they are shared,
+    read-only empty containers, so use addAttribute() / addChild() instead
+    of changing attributes or children directly.
     """
+    __slots__ = ("name", "attributes", "parent", "chars", "children",
+                 "childIndex", "fieldValues")
+
     def __init__(self, name, parent=None):
         self.name = name
-        self.attributes = {}
+        self.attributes = _noItems
         self.parent = parent
         self.chars = ""
-        self.children = []
+        self.children = ()
+
+        # child name -> list of children with that name
+        self.childIndex = _noItems
+
+        # field name -> field value, only filled for a 'fields' element
+        self.fieldValues = _noItems
+
+    def __getstate__(self):
+        # The shared empty containers can't be pickled: store None instead
+        return (self.name, self.attributes or None, self.parent, self.chars,
+                self.children or None, self.childIndex or None,
+                self.fieldValues or None)
+
+    def __setstate__(self, state):
+        (self.name, self.attributes, self.parent, self.chars,
+         self.children, self.childIndex, self.fieldValues) = state
+        if self.attributes is None:
+            self.attributes = _noItems
+        if self.children is None:
+            self.children = ()
+        if self.childIndex is None:
+            self.childIndex = _noItems
+        if self.fieldValues is None:
+            self.fieldValues = _noItems
 
     def __str__(self):
         """String representation of this netlist element
@@ -100,35 +165,47 @@ class xmlElement():
         amChild -- If set to True, the start of document is not returned.
 
         """
-        s = ""
+        return "".join(self.iterXML(nestLevel, amChild))
 
-        indent = ""
-        for i in range(nestLevel):
-            indent += "    "
+    def iterXML(self, nestLevel=0, amChild=False):
+        """Generate this element formatted as XML, in chunks. Text and
+        attribute values are escaped. See formatXML() for the keywords.
 
+        """
         if not amChild:
-            s = "<?xml version=\"1.0\" encoding=\"utf-8\"?>\n"
-
-        s += indent + "<" + self.name
-        for a in self.attributes:
-            s += " " + a + "=\"" + self.attributes[a] + "\""
+            yield "<?xml version=\"1.0\" encoding=\"utf-8\"?>\n"
 
-        if (len(self.chars) == 0) and (len(self.children) == 0):
-            s += "/>"
-        else:
-            s += ">" + self.chars
-
-        for c in self.children:
-            s += "\n"
-            s += c.formatXML(nestLevel+1, True)
-
-        if (len(self.children) > 0):
-            s += "\n" + indent
-
-        if (len(self.children) > 0) or (len(self.chars) > 0):
-            s += "</" + self.name + ">"
-
-        return s
+        # Depth first without recursion: the stack holds (element, indent,
+        # iterator over the remaining children) of the open ancestors
+        stack = []
+        element = self
+        s = ""
+        while True:
+            indent = "    " * (nestLevel + len(stack))
+            s += indent + "<" + element.name
+            for a, value in element.attributes.items():
+                s += " " + a + "=" + _xmlAttr(value)
+
+            if (len(element.chars) == 0) and (len(element.children) == 0):
+                yield s + "/>"
+            elif len(element.children) == 0:
+                yield s + ">" + _xmlText(element.chars) + "</" + element.name + ">"
+            else:
+                yield s + ">" + _xmlText(element.chars)
+                stack.append((element, indent, iter(element.children)))
+
+            # Continue with the next child of the innermost open element,
+            # closing the elements that have no children left
+            while stack:
+                parent, parentIndent, children = stack[-1]
+                element = next(children, None)
+                if element is not None:
+                    s = "\n"
+                    break
+                stack.pop()
+                yield "\n" + parentIndent + "</" + parent.name + ">"
+            else:
+                return
 
     def formatHTML(self, amChild=False):
         """Return this element formatted as HTML
@@ -137,10 +214,15 @@ class xmlElement():
         amChild -- If set to True, the start of document is not returned
 
         """
-        s = ""
+        return "".join(self.iterHTML(amChild))
+
+    def iterHTML(self, amChild=False):
+        """Generate this element formatted as HTML, in chunks. Text and
+        attribute values are escaped. See formatHTML() for the keywords.
 
+        """
         if not amChild:
-            s = """<!DOCTYPE html PUBLIC "-//W3C//DTD XHTML 1.0 Transitional//EN"
+            yield """<!DOCTYPE html PUBLIC "-//W3C//DTD XHTML 1.0 Transitional//EN"
                 "http://www.w3.org/TR/xhtml1/DTD/xhtml1-transitional.dtd">
                 <html xmlns="http://www.w3.org/1999/xhtml">
                 <head>
@@ -151,32 +233,51 @@ class xmlElement():
                 <table>
                 """
 
-        s += "<tr><td><b>" + self.name + "</b><br>" + self.chars + "</td><td><ul>"
-        for a in self.attributes:
-            s += "<li>" + a + " = " + self.attributes[a] + "</li>"
+        # A row per element, depth first without recursion
+        stack = [iter((self,))]
+        while stack:
+            element = next(stack[-1], None)
+            if element is None:
+                stack.pop()
+                continue
 
-        s += "</ul></td></tr>\n"
+            s = "<tr><td><b>" + element.name + "</b><br>" + _xmlText(element.chars) + "</td><td><ul>"
+            for a, value in element.attributes.items():
+                s += "<li>" + a + " = " + _xmlText(value) + "</li>"
+            yield s + "</ul></td></tr>\n"
 
-        for c in self.children:
-            s += c.formatHTML(True)
+            if element.children:
+                stack.append(iter(element.children))
 
         if not amChild:
-            s += """</table>
+            yield """</table>
                 </body>
                 </html>"""
 
-        return s
-
     def addAttribute(self, attr, value):
         """Add an attribute to this element"""
         if type(value) != str: value = value.encode('utf-8')
+        if self.attributes is _noItems:
+            self.attributes = {}
         self.attributes[attr] = value
 
+    def addAttributes(self, attributes):
+        """Add all attributes of a dict to this element. The element may keep
+        the dict itself: don't change it afterwards."""
+        if not attributes:
+            return
+        if self.attributes is _noItems:
+            self.attributes = attributes
+        else:
+            self.attributes.update(attributes)
+
     def setAttribute(self, attr, value):
         """Set an attributes value - in fact does the same thing as add
         attribute
 
         """
+        if self.attributes is _noItems:
+            self.attributes = {}
         self.attributes[attr] = value
 
     def setChars(self, chars):
@@ -189,8 +290,33 @@ class xmlElement():
 
     def addChild(self, child):
         """Add a child element to this element"""
+        if not self.children:
+            self.children = []
+            self.childIndex = {}
         self.children.append(child)
-        return self.children[len(self.children) - 1]
+        named = self.childIndex.get(child.name)
+        if named is None:
+            self.childIndex[child.name] = [child]
+        else:
+            named.append(child)
+        return child
+
+    def close(self):
+        """Called when the end of this element is parsed. A field's value is
+        only complete at this point, so this is where it gets indexed in the
+        parent 'fields' element.
+        """
+        if self.name == "field" and self.parent and self.parent.name == "fields":
+            self.parent.addFieldValue(self.attributes.get("name", ""), self.chars)
+
+    def addFieldValue(self, name, value):
+        """Index the value of a field named name. Like get(), the first
+        non-empty value wins.
+        """
+        if value != "" and not name in self.fieldValues:
+            if self.fieldValues is _noItems:
+                self.fieldValues = {}
+            self.fieldValues[name] = value
 
     def getParent(self):
         """Get the parent of this element (Could be None)"""
@@ -201,22 +327,50 @@ class xmlElement():
 
         Keywords:
         name -- The name of the child element to return"""
-        for child in self.children:
-            if child.name == name:
-                return child
+        named = self.childIndex.get(name)
+        if named:
+            return named[0]
         return None
 
     def getChildren(self, name=None):
         if name:
             # return _all_ children named "name"
-            ret = []
-            for child in self.children:
-                if child.name == name:
-                    ret.append(child)
-            return ret
+            return list(self.childIndex.get(name, ()))
         else:
             return self.children
 
+    def getChildChars(self, name):
+        """Return the text data of the first child named 'name', or an empty
+        string if there is no such child"""
+        named = self.childIndex.get(name)
+        if named:
+            return named[0].chars
+        return ""
+
+    def getChildAttribute(self, name, attribute):
+        """Return an attribute of the first child named 'name', or an empty
+        string if there is no such child or attribute"""
+        named = self.childIndex.get(name)
+        if named:
+            return named[0].attributes.get(attribute, "")
+        return ""
+
+    def getFieldValues(self):
+        """Return the field name -> value dict of the 'fields' child of this
+        element (empty if there is no such child)"""
+        named = self.childIndex.get("fields")
+        if named:
+            return named[0].fieldValues
+        return _noItems
+
+    def getFieldValue(self, name):
+        """Return the value of the field named 'name' from the 'fields' child
+        of this element, or an empty string if there is no such field"""
+        named = self.childIndex.get("fields")
+        if named:
+            return named[0].fieldValues.get(name, "")
+        return ""
+
     def get(self, elemName, attribute="", attrmatch=""):
         """Return the text data for either an attribute or an xmlElement
         """
@@ -268,16 +422,16 @@ class libpart():
         #return str(self.element)
 
     def getLibName(self):
-        return self.element.get("libpart", "lib")
+        return self.element.attributes.get("lib", "")
 
     def getPartName(self):
-        return self.element.get("libpart", "part")
+        return self.element.attributes.get("part", "")
 
     def getDescription(self):
-        return self.element.get("description")
+        return self.element.getChildChars("description")
 
     def getField(self, name):
-        return self.element.get("field", "name", name)
+        return self.element.getFieldValue(name)
 
     def getFieldNames(self):
         """Return a list of field names in play for this libpart.
@@ -308,6 +462,63 @@ class libpart():
         return None
 
 
+# Splits a reference into its prefix and number, e.g. 'R12' -> ('R', '12')
+ref_prefix_regex = re.compile('(^.*[^0-9]+)([0-9]+)')
+
+def refSortKey(ref):
+    """Return a natural sort key (prefix, number, ref) for a reference, so
+    R2 sorts before R10. References without a number get number -1.
+    """
+    match = ref_prefix_regex.match(ref)
+    if match is None:
+        return (ref, -1, ref)
+    return (match.group(1), int(match.group(2)), ref)
+
+
+class compRecord():
+    """Compact, read-only snapshot of the component data used to build a BOM.
+    Records are built once when the netlist is loaded (see
+    netlist.endDocument()), so grouping, filtering and BOM generation don't
+    have to go through the xml tree for every access.
+
+    fields holds the component's own (non-empty) field values, and
+    libFields those of its libpart. Both are the dicts of the xml tree, not
+    copies: libFields is shared by all components of the same libpart. Use
+    getField() or getFields() for the resolved values (as comp.getField()).
+    """
+    __slots__ = ('ref', 'refKey', 'value', 'footprint', 'translatedFootprint',
+                 'description', 'dnp', 'fields', 'libFields')
+
+    def __init__(self, component):
+        self.ref = component.getRef()
+        self.refKey = refSortKey(self.ref)
+        self.value = component.getValue()
+        self.footprint = component.getFootprint()
+        self.translatedFootprint = translate_fp(self.footprint)
+        self.description = component.getDescription()
+        self.dnp = component.getDNP()
+
+        self.fields = component.element.getFieldValues()
+        if component.libpart:
+            self.libFields = component.libpart.element.getFieldValues()
+        else:
+            self.libFields = _noItems
+
+    def getField(self, name):
+        """Return the resolved value of a field, or an empty string"""
+        value = self.fields.get(name)
+        if value is None:
+            return self.libFields.get(name, "")
+        return value
+
+    def getFields(self):
+        """Return a new dict with the resolved value of each field: the
+        component's own fields, completed with the fields of its libpart"""
+        fields = dict(self.libFields)
+        fields.update(self.fields)
+        return fields
+
+
 class comp():
     """Class for a component, aka 'comp' in the xml netlist file.
     This component class is implemented by wrapping an xmlElement instance
@@ -318,50 +529,64 @@ class comp():
         self.element = xml_element
         self.libpart = None
 
+        # compRecord with the BOM data of this component, see getRecord()
+        self.record = None
+
         # Set to true when this component is included in a component group
         self.grouped = False
 
     def __eq__(self, other):
-        """ Equivalency operator, remember this can be easily overloaded
-            2 components are equivalent ( i.e. can be grouped
-            if they have same value and same footprint
-
-            Override the component equivalence operator must be done before
-            loading the netlist, otherwise all components will have the original
-            equivalency operator.
-
-            You have to define a comparison module (for instance named myEqu)
-            and add the line;
-                kicad_netlist_reader.comp.__eq__ = myEqu
-            in your bom generator script before calling the netliste reader by something like:
-                net = kicad_netlist_reader.netlist(sys.argv[1])
+        """ Equivalency operator: 2 components are equivalent ( i.e. can be
+            grouped) if they have the same group key, see getGroupKey().
+
+            Note that netlist.groupComponents() does not use this operator:
+            to customize the grouping, pass a key function to it instead.
+        """
+        return self.getGroupKey() == other.getGroupKey()
+
+    def getGroupKey(self):
+        """Return the key used to group components: two components with the
+        same key end up in the same BOM line. The default key is the value
+        together with the translated footprint.
+
+        A custom grouping can be defined by passing a key function to
+        netlist.groupComponents(), or by overriding this method:
+            kicad_netlist_reader.comp.getGroupKey = myKey
         """
-        result = False
-        if self.getValue() == other.getValue():
-            if translate_fp(self.getFootprint()) == translate_fp(other.getFootprint()):
-                result = True
-        return result
+        record = self.getRecord()
+        return (record.value, record.translatedFootprint)
+
+    def getRecord(self):
+        """Return the compRecord of this component. It is normally built when
+        the netlist is loaded, but is (re)built here if the component changed
+        since then.
+        """
+        if self.record is None:
+            self.record = compRecord(self)
+        return self.record
 
     def setLibPart(self, part):
         self.libpart = part
+        self.record = None
 
     def getLibPart(self):
         return self.libpart
 
     def getPartName(self):
-        return self.element.get("libsource", "part")
+        return self.element.getChildAttribute("libsource", "part")
 
     def getLibName(self):
-        return self.element.get("libsource", "lib")
+        return self.element.getChildAttribute("libsource", "lib")
 
     def setValue(self, value):
         """Set the value of this component"""
         v = self.element.getChild("value")
         if v:
             v.setChars(value)
+            self.record = None
 
     def getValue(self):
-        return self.element.get("value")
+        return self.element.getChildChars("value")
 
     def getField(self, name, libraryToo=True):
         """Return the value of a field named name. The component is first
@@ -375,7 +600,7 @@ class comp():
                         in component itself
         """
 
-        field = self.element.get("field", "name", name)
+        field = self.element.getFieldValue(name)
         if field == "" and libraryToo and self.libpart:
             field = self.libpart.getField(name)
         return field
@@ -405,25 +630,415 @@ class comp():
 
 
     def getRef(self):
-        return self.element.get("comp", "ref")
+        return self.element.attributes.get("ref", "")
 
     def getFootprint(self, libraryToo=True):
-        ret = self.element.get("footprint")
+        ret = self.element.getChildChars("footprint")
         if ret == "" and libraryToo and self.libpart:
             ret = self.libpart.getFootprint()
         return ret
 
     def getDatasheet(self, libraryToo=True):
-        ret = self.element.get("datasheet")
+        ret = self.element.getChildChars("datasheet")
         if ret == "" and libraryToo and self.libpart:
             ret = self.libpart.getDatasheet()
         return ret
 
     def getTimestamp(self):
-        return self.element.get("tstamp")
+        return self.element.getChildChars("tstamp")
 
     def getDescription(self):
-        return self.element.get("libsource", "description")
+        return self.element.getChildAttribute("libsource", "description")
+
+
+# Global inline flags at the start of a regular expression, e.g. '(?i)'
+_leadingFlags = re.compile(r"(?:\(\?[aiLmsux]+\))+")
+
+class _anyMatch():
+    """A list of regular expressions: match() is true if one of them matches
+    (re.match). They are merged into one regex, so a string is matched once
+    instead of once per expression. Leading global flags ('(?i)abc') are
+    turned into scoped flags ('(?i:abc)'). Expressions that can't be merged,
+    like those with groups (whose numbers would change), are matched one
+    by one."""
+    def __init__(self, rexes):
+        merged = []
+        self.separate = []
+        for rex in rexes:
+            compiled = re.compile(rex)
+            if compiled.groups:
+                self.separate.append(compiled)
+                continue
+
+            flags = _leadingFlags.match(rex)
+            if flags:
+                letters = flags.group().replace("(?", "").replace(")", "")
+                merged.append((compiled, "(?" + letters + ":" + rex[flags.end():] + ")"))
+            else:
+                merged.append((compiled, "(?:" + rex + ")"))
+
+        self.merged = None
+        if merged:
+            try:
+                self.merged = re.compile("|".join(scoped for compiled, scoped in merged))
+            except re.error:
+                # e.g. a verbose expression with a comment: match it one by one
+                self.separate += [compiled for compiled, scoped in merged]
+
+    def match(self, string):
+        if self.merged is not None and self.merged.match(string):
+            return True
+        for rex in self.separate:
+            if rex.match(string):
+                return True
+        return False
+
+
+class componentFilter():
+    """Compiled set of rules that decide which components to leave out of
+    the BOM. Each list of regular expressions is merged into one regex where
+    possible (see _anyMatch), and all rules are checked in a single pass over
+    the component records.
+
+    Keywords:
+    references, values, footprints -- lists of regular expressions, a
+    component is excluded if one of them matches (re.match) its reference,
+    value or footprint. None means: use the module level excluded_* list.
+    fields -- dict of field name -> regular expression, a component is
+    excluded if the regex matches the value of that field. A field mapped
+    to None excludes components with any non-empty value for that field.
+    The default excludes components with an "Installed" field of 'NU'.
+    dnp -- if True, exclude components with the 'dnp' property (KiCad7+).
+    """
+    def __init__(self, references=None, values=None, footprints=None,
+                 fields=None, dnp=False):
+        if references is None:
+            references = excluded_references
+        if values is None:
+            values = excluded_values
+        if footprints is None:
+            footprints = excluded_footprints
+
+        # This is a fairly personal way to flag DNS (Do Not Stuff).  NU for
+        # me means Normally Uninstalled.
+        if fields is None:
+            fields = {"Installed": "NU$"}
+
+        self.references = self._compile(references)
+        self.values = self._compile(values)
+        self.footprints = self._compile(footprints)
+        self.fields = [(name, re.compile(rex) if rex is not None else None)
+                       for name, rex in fields.items()]
+        self.dnp = dnp
+
+    @staticmethod
+    def _compile(rexes):
+        """Compile a list of regular expressions into one _anyMatch, None if
+        empty"""
+        if not rexes:
+            return None
+        return _anyMatch(rexes)
+
+    def excludes(self, component):
+        """Return True if the component should be left out of the BOM"""
+        record = component.getRecord()
+
+        if self.dnp and record.dnp:
+            return True
+        if self.references and self.references.match(record.ref):
+            return True
+        if self.values and self.values.match(record.value):
+            return True
+        if self.footprints and self.footprints.match(record.footprint):
+            return True
+
+        for name, rex in self.fields:
+            value = record.getField(name)
+            if rex is None:
+                if value:
+                    return True
+            elif rex.match(value):
+                return True
+
+        return False
+
+    def apply(self, components):
+        """Return a list of the components that are not excluded"""
+        return [c for c in components if not self.excludes(c)]
+
+
+# The default componentFilter, rebuilt when one of the excluded_* lists changes
+_default_filter = (None, None)
+
+def defaultComponentFilter():
+    """Return a componentFilter built from the excluded_* lists above. It is
+    cached, so the regular expressions are only compiled once.
+    """
+    global _default_filter
+    key = (tuple(excluded_references), tuple(excluded_values), tuple(excluded_footprints))
+    if _default_filter[0] != key:
+        _default_filter = (key, componentFilter())
+    return _default_filter[1]
+
+
+# A pin of a component on a net: interned strings, pinfunction and pintype
+# are "" if the netlist does not have them
+netNode = namedtuple("netNode", ("ref", "pin", "pinfunction", "pintype"))
+
+class netIndex():
+    """
+    Connectivity lookups of the nets of a netlist: the nodes on a net (by
+    net name or code), and the nets and pins of a component (by ref).
+    Built once, after which each lookup is a dict access.
+
+    Nets are numbered in netlist order. The nodes of a net are a tuple of
+    netNode, with interned strings that are shared by all nodes.
+    """
+    def __init__(self, nets=()):
+        self.names = []         # net number -> name
+        self.codes = []         # net number -> code
+        self.nodes = []         # net number -> tuple of netNode
+        self._byName = {}       # name -> net number
+        self._byCode = {}       # code -> net number
+        self._pins = {}         # ref -> tuple of (pin, net number)
+
+        intern = sys.intern
+        pins = {}
+        for net in nets:
+            number = len(self.names)
+            name = intern(net.attributes.get("name", ""))
+            code = intern(net.attributes.get("code", ""))
+            self.names.append(name)
+            self.codes.append(code)
+            self._byName.setdefault(name, number)
+            self._byCode.setdefault(code, number)
+
+            nodes = []
+            for node in net.getChildren("node"):
+                attrs = node.attributes
+                ref = intern(attrs.get("ref", ""))
+                pin = intern(attrs.get("pin", ""))
+                nodes.append(netNode(ref, pin,
+                                     intern(attrs.get("pinfunction", "")),
+                                     intern(attrs.get("pintype", ""))))
+                pins.setdefault(ref, []).append((pin, number))
+            self.nodes.append(tuple(nodes))
+
+        self._pins = {ref: tuple(p) for ref, p in pins.items()}
+
+    def __len__(self):
+        return len(self.names)
+
+    def getNetNumber(self, name=None, code=None):
+        """Return the number of the net with this name (or code), or None"""
+        if name is not None:
+            return self._byName.get(name)
+        return self._byCode.get(str(code))
+
+    def getNodes(self, name=None, code=None):
+        """Return the nodes (netNode tuples) of the net with this name (or
+        code), an empty tuple if there is no such net"""
+        number = self.getNetNumber(name, code)
+        if number is None:
+            return ()
+        return self.nodes[number]
+
+    def getPins(self, ref):
+        """Return the (pin, net name) pairs of a component"""
+        return tuple((pin, self.names[number]) for pin, number in self._pins.get(ref, ()))
+
+    def getNets(self, ref):
+        """Return the names of the nets a component is connected to, in
+        netlist order without duplicates"""
+        numbers = sorted(set(number for pin, number in self._pins.get(ref, ())))
+        return tuple(self.names[number] for number in numbers)
+
+    def getNet(self, ref, pin):
+        """Return the name of the net a pin of a component is on, or None"""
+        for p, number in self._pins.get(ref, ()):
+            if p == pin:
+                return self.names[number]
+        return None
+
+    def getPinCount(self, ref):
+        """Return the number of connected pins of a component"""
+        return len(self._pins.get(ref, ()))
+
+
+@functools.lru_cache(maxsize=None)
+def _numpy():
+    """Return the numpy module, or None if it is not installed. NumPy is only
+    imported when a component table is built: importing it takes longer than
+    loading a small netlist."""
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+
+class componentTable():
+    """
+    Columnar view of components, for bulk queries over many components:
+    one column per property (ref, value, footprint, translatedFootprint,
+    libpart) and per user field found in any of the components: their own
+    fields and those of their libparts, except for the mandatory fields of
+    the libparts (Reference, Value, Footprint and Datasheet). A field with
+    the name of a property is left out.
+
+    A column holds an integer code per component (row), and the distinct
+    strings of the column (code -> string). Code 0 is always "" (e.g. a
+    field the component does not have). The codes are an array.array, or a
+    NumPy array if useNumpy is set, so they can be compared, counted and
+    grouped in bulk:
+
+        table = net.getComponentTable()
+        rows = table.select("value", "10k")
+        refs = table.getStrings("ref")
+        mpns = table.getValues("MPN")
+        byFootprint = table.groupBy("translatedFootprint")
+
+        # with NumPy:
+        codes = table.getCodes("MPN")
+        missing = (codes == 0).nonzero()[0]
+
+    The table is built in one pass over the component records and is not
+    updated when the components change.
+    """
+    propertyColumns = ("ref", "value", "footprint", "translatedFootprint", "libpart")
+    mandatoryFields = ("Reference", "Value", "Footprint", "Datasheet")
+
+    def __init__(self, components, useNumpy=False):
+        numpy = _numpy() if useNumpy else None
+        if useNumpy and numpy is None:
+            raise ValueError("NumPy arrays selected, but NumPy is not installed")
+
+        self.components = list(components)
+        rows = len(self.components)
+        self._codes = {}        # column name -> codes, one per row
+        self._values = {}       # column name -> list of strings, code -> string
+        self._lookup = {}       # column name -> dict of string -> code
+
+        zeros = array("i", [0]) * rows
+        for name in self.propertyColumns:
+            self._addColumn(name, zeros)
+
+        for row, c in enumerate(self.components):
+            r = c.getRecord()
+            libpart = c.getLibPart()
+            libpart = libpart.getLibName() + ":" + libpart.getPartName() if libpart else ""
+
+            self._set("ref", row, r.ref)
+            self._set("value", row, r.value)
+            self._set("footprint", row, r.footprint)
+            self._set("translatedFootprint", row, r.translatedFootprint)
+            self._set("libpart", row, libpart)
+            for name, value in r.fields.items():
+                # Properties come first when a field has the same name: the
+                # field has no column of its own
+                if name in self.propertyColumns:
+                    continue
+                if not name in self._codes:
+                    self._addColumn(name, zeros)
+                self._set(name, row, value)
+            for name, value in r.libFields.items():
+                if name in self.mandatoryFields or name in r.fields or name in self.propertyColumns:
+                    continue
+                if not name in self._codes:
+                    self._addColumn(name, zeros)
+                self._set(name, row, value)
+
+        if useNumpy:
+            for name, codes in self._codes.items():
+                self._codes[name] = numpy.frombuffer(codes, dtype=numpy.intc)
+
+    def _addColumn(self, name, zeros):
+        self._codes[name] = array("i", zeros)
+        self._values[name] = [""]
+        self._lookup[name] = {"": 0}
+
+    def _set(self, name, row, value):
+        lookup = self._lookup[name]
+        code = lookup.get(value)
+        if code is None:
+            code = len(lookup)
+            lookup[value] = code
+            self._values[name].append(value)
+        self._codes[name][row] = code
+
+    def __len__(self):
+        return len(self.components)
+
+    def getColumnNames(self):
+        """Return the names of all columns: the properties, then the fields"""
+        return list(self._codes)
+
+    def getFieldNames(self):
+        """Return the names of the field columns: the union of the (non-empty)
+        fields of all components"""
+        return [name for name in self._codes if not name in self.propertyColumns]
+
+    def getCodes(self, name):
+        """Return the codes of a column, one per row"""
+        return self._codes[name]
+
+    def getValues(self, name):
+        """Return the distinct strings of a column, indexed by code"""
+        return self._values[name]
+
+    def getCode(self, name, value):
+        """Return the code of a string in a column, or None if no component
+        has that value"""
+        return self._lookup[name].get(value)
+
+    def getStrings(self, name):
+        """Return the strings of a column, one per row"""
+        values = self._values[name]
+        return [values[code] for code in self._codes[name]]
+
+    def select(self, name, value):
+        """Return the rows (positions in components) where the column has
+        this value"""
+        code = self.getCode(name, value)
+        if code is None:
+            return []
+        return self.selectCodes(name, (code,))
+
+    def selectMatching(self, name, regex):
+        """Return the rows where the column matches a regular expression. The
+        expression is only matched once per distinct value."""
+        rex = re.compile(regex)
+        codes = [code for code, value in enumerate(self._values[name]) if rex.match(value)]
+        return self.selectCodes(name, codes)
+
+    def selectCodes(self, name, codes):
+        """Return the rows where the code of the column is one of codes"""
+        column = self._codes[name]
+        if not isinstance(column, array):
+            numpy = _numpy()
+            return numpy.flatnonzero(numpy.isin(column, list(codes))).tolist()
+        codes = set(codes)
+        return [row for row, code in enumerate(column) if code in codes]
+
+    def groupBy(self, *names):
+        """Group the rows by the values of one or more columns. Returns a dict
+        of (tuple of strings) -> list of rows, in order of first row."""
+        columns = [self._codes[name] for name in names]
+        groups = {}
+        for row, key in enumerate(zip(*columns)):
+            rows = groups.get(key)
+            if rows is None:
+                groups[key] = [row]
+            else:
+                rows.append(row)
+
+        values = [self._values[name] for name in names]
+        return {tuple(v[code] for v, code in zip(values, key)): rows
+                for key, rows in groups.items()}
+
+    def getRows(self, rows):
+        """Return the components of a list of rows"""
+        return [self.components[row] for row in rows]
 
 
 class netlist():
@@ -432,11 +1047,14 @@ class netlist():
     scripts
 
     """
-    def __init__(self, fname=""):
+    def __init__(self, fname="", skip=(), backend="auto", cacheDir=None):
         """Initialiser for the genericNetlist class
 
         Keywords:
         fname -- The name of the generic netlist file to open (Optional)
+        skip -- Names of sections that are not loaded, see load()
+        backend -- The XML parser to use, see load()
+        cacheDir -- Directory for parsed netlist snapshots, see load()
 
         """
         self.design = None
@@ -445,18 +1063,20 @@ class netlist():
         self.libraries = []
         self.nets = []
 
+        # lookups for findLibPart(), see indexLibParts()
+        self._libpartIndex = None
+        self._aliasIndex = None
+
+        # connectivity lookups, see getNetIndex()
+        self._netIndex = None
+
         # The entire tree is loaded into self.tree
         self.tree = []
 
         self._curr_element = None
 
-        # component blacklist regexs, made from exluded_* above.
-        self.excluded_references = []
-        self.excluded_values = []
-        self.excluded_footprints = []
-
         if fname != "":
-            self.load(fname)
+            self.load(fname, skip, backend, cacheDir)
 
     def addChars(self, content):
         """Add characters to the current element"""
@@ -498,22 +1118,60 @@ class netlist():
         # When the document is complete, the library parts must be linked to
         # the components as they are seperate in the tree so as not to
         # duplicate library part information for every component
-        for c in self.components:
-            for p in self.libparts:
-                if p.getLibName() == c.getLibName():
-                    if p.getPartName() == c.getPartName():
-                        c.setLibPart(p)
-                        break
-                    else:
-                        aliases = p.getAliases()
-                        if aliases and self.aliasMatch( c.getPartName(), aliases ):
-                            c.setLibPart(p)
-                            break;
+        with sync_stats.phase('libpart linking'):
+            self.indexLibParts()
+            for c in self.components:
+                p = self.findLibPart(c.getLibName(), c.getPartName())
+                if p:
+                    c.setLibPart(p)
+
+                if not c.getLibPart():
+                    print( 'missing libpart for ref:', c.getRef(), c.getPartName(), c.getLibName() )
+
+                # Snapshot the BOM data now that the libpart is known
+                c.record = compRecord(c)
 
-            if not c.getLibPart():
-                print( 'missing libpart for ref:', c.getRef(), c.getPartName(), c.getLibName() )
+        self._netIndex = netIndex(self.nets)
 
 
+    def indexLibParts(self):
+        """Build the (lib, part) and (lib, alias) -> libpart lookups used by
+        findLibPart(). The values are positions in self.libparts, so the first
+        libpart that matches by either name or alias can be found.
+        """
+        self._libpartIndex = {}
+        self._aliasIndex = {}
+        for i, p in enumerate(self.libparts):
+            lib = p.getLibName()
+            self._libpartIndex.setdefault((lib, p.getPartName()), i)
+            aliases = p.getAliases()
+            if aliases:
+                for alias in aliases:
+                    self._aliasIndex.setdefault((lib, alias), i)
+
+    def findLibPart(self, libName, partName):
+        """Return the first libpart from library libName that is named
+        partName or has partName as alias, or None if there is no such part.
+        """
+        if self._libpartIndex is None:
+            self.indexLibParts()
+
+        by_name = self._libpartIndex.get((libName, partName))
+        by_alias = self._aliasIndex.get((libName, partName))
+        if by_name is None and by_alias is None:
+            return None
+        if by_name is None or (by_alias is not None and by_alias < by_name):
+            return self.libparts[by_alias]
+        return self.libparts[by_name]
+
+    def getNetIndex(self):
+        """Return the connectivity lookups of the nets (a netIndex), e.g.
+        getNetIndex().getNodes("GND") or getNetIndex().getNets("U5").
+        Empty if the nets were skipped while loading."""
+        if self._netIndex is None:
+            self._netIndex = netIndex(self.nets)
+        return self._netIndex
+
     def aliasMatch(self, partName, aliasList):
         for alias in aliasList:
             if partName == alias:
@@ -522,6 +1180,7 @@ class netlist():
 
     def endElement(self):
         """End the current element and switch to its parent"""
+        self._curr_element.close()
         self._curr_element = self._curr_element.getParent()
 
     def getDate(self):
@@ -579,157 +1238,85 @@ class netlist():
 
         return ret       # this is a python 'set'
 
-    def getInterestingComponents(self):
+    def getInterestingComponents(self, componentFilter=None):
         """Return a subset of all components, those that should show up in the BOM.
         Omit those that should not, by consulting the blacklists:
         excluded_values, excluded_refs, and excluded_footprints, which hold one
         or more regular expressions.  If any of the the regular expressions match
         the corresponding field's value in a component, then the component is exluded.
-        """
-
-        # pre-compile all the regex expressions:
-        del self.excluded_references[:]
-        del self.excluded_values[:]
-        del self.excluded_footprints[:]
 
-        for rex in excluded_references:
-            self.excluded_references.append( re.compile( rex ) )
-
-        for rex in excluded_values:
-            self.excluded_values.append( re.compile( rex ) )
-
-        for rex in excluded_footprints:
-            self.excluded_footprints.append( re.compile( rex ) )
+        Keywords:
+        componentFilter -- a componentFilter to use instead of the one built
+        from the blacklists above.
+        """
+        if componentFilter is None:
+            componentFilter = defaultComponentFilter()
 
         # the subset of components to return, considered as "interesting".
-        ret = []
-
-        # run each component thru a series of tests, if it passes all, then add it
-        # to the interesting list 'ret'.
-        for c in self.components:
-            exclude = False
-            if not exclude:
-                for refs in self.excluded_references:
-                    if refs.match(c.getRef()):
-                        exclude = True
-                        break;
-            if not exclude:
-                for vals in self.excluded_values:
-                    if vals.match(c.getValue()):
-                        exclude = True
-                        break;
-            if not exclude:
-                for mods in self.excluded_footprints:
-                    if mods.match(c.getFootprint()):
-                        exclude = True
-                        break;
-
-            if not exclude:
-                # This is a fairly personal way to flag DNS (Do Not Stuff).  NU for
-                # me means Normally Uninstalled.  You can 'or in' another expression here.
-                if c.getField( "Installed" ) == 'NU':
-                    exclude = True
-
-            if not exclude:
-                ret.append(c)
+        ret = componentFilter.apply(self.components)
 
         # Sort first by ref as this makes for easier to read BOM's
-        def f(v):
-            return re.sub(r'([A-z]+)[0-9]+', r'\1', v) + '%08i' % int(re.sub(r'[A-z]+([0-9]+)', r'\1', v))
-        ret.sort(key=lambda g: f(g.getRef()))
+        ret.sort(key=lambda c: c.getRecord().refKey)
 
         return ret
 
 
-    def groupComponents(self, components = None):
+    def groupComponents(self, components = None, key = None):
         """Return a list of component lists. Components are grouped together
-        when the value, library and part identifiers match.
+        when their group keys match (by default: value and footprint, see
+        comp.getGroupKey()).
 
         Keywords:
         components -- is a list of components, typically an interesting subset
         of all components, or None.  If None, then all components are looked at.
+        key -- function that returns a hashable group key for a component, or
+        None to use comp.getGroupKey().
         """
-        if not components:
+        if components is None:
             components = self.components
 
-        groups = []
-
-        # Make sure to start off will all components ungrouped to begin with
-        for c in components:
-            c.grouped = False
+        if key is None:
+            key = comp.getGroupKey
 
-        # Group components based on the value, library and part identifiers
+        # Bucket the components on their group key. Dicts keep insertion
+        # order, so the groups are in order of their first component.
+        buckets = {}
         for c in components:
-            if c.grouped == False:
-                c.grouped = True
-                newgroup = []
-                newgroup.append(c)
-
-                # Check every other ungrouped component against this component
-                # and add to the group as necessary
-                for ci in components:
-                    if ci.grouped == False and ci == c:
-                        newgroup.append(ci)
-                        ci.grouped = True
+            k = key(c)
+            group = buckets.get(k)
+            if group is None:
+                buckets[k] = [c]
+            else:
+                group.append(c)
+            c.grouped = True
 
-                # Add the new component group to the groups list
-                groups.append(newgroup)
+        groups = list(buckets.values())
 
         # Each group is a list of components, we need to sort each list first
         # to get them in order as this makes for easier to read BOM's
-        def f(v):
-            return re.sub(r'([A-z]+)[0-9]+', r'\1', v) + '%08i' % int(re.sub(r'[A-z]+([0-9]+)', r'\1', v))
-
         sorted_groups = []
         for g in groups:
-            g = sorted(g, key=lambda g: f(g.getRef()))
+            g = sorted(g, key=lambda c: c.getRecord().refKey)
             sorted_groups.append(g)
 
-        # Finally, sort the groups to order the references alphabetically
-       # sorted_groups = sorted(sorted_groups, key=lambda group: f(group[0].getRef()))
-
-        ref_prefix_regex = re.compile('(^.*[^0-9]+)([0-9]+)')
-
-
-        def _custom_compare(a, b):
+        def _group_sort_key(group):
             """
-            Compare footprints based on ref + value, use for sorting
+            Sort key for groups based on ref + value of their first component
 
-            Components are compared based on the reference prefix: C1 sorts before R1."
+            Components are sorted based on the reference prefix: C1 sorts before R1."
             Components with the same reference prefix are sorted based on the SI-suffixed
             values: 18pF sorts before 4nF
             """
-            a = a[0]
-            b = b[0]
-
-            match_a = ref_prefix_regex.match(a.getRef())
-            match_b = ref_prefix_regex.match(b.getRef())
-
-            if match_a is None or match_b is None:
-                # Unexpected: a reference that does not match the regex.
-                # Fall back to alphabetical sorting
-                if a == b:
-                    return 0
-                return -1 if (a < b) else 1
+            record = group[0].getRecord()
 
+            # A reference without number (unexpected) has the full
+            # reference as prefix, see refSortKey()
+            prefix = record.refKey[0]
 
-            prefix_a = match_a.group(1)
-            prefix_b = match_b.group(1)
+            return (prefix, SI_key(record.value))
 
-            value_a = a.getValue()
-            value_b = b.getValue()
 
-            # Same 'type' of components based on the ref prefix (e.g. both 'C' or both 'R').
-            # Sub-sort these based on component values
-            if prefix_a == prefix_b:
-
-                return compare_SI(value_a, value_b)
-
-            # Different 'type' of component: just sort on ref prefix
-            return -1 if (prefix_a < prefix_b) else 1
-
-
-        sorted_groups = sorted(sorted_groups, key=cmp_to_key(_custom_compare))
+        sorted_groups.sort(key=_group_sort_key)
 
         return sorted_groups
 
@@ -760,6 +1347,16 @@ class netlist():
                 return ret
         return group[0].getLibPart().getFootprint()
 
+    def getComponentTable(self, components=None, useNumpy=None):
+        """Return a columnar view of the components (all components by
+        default), see componentTable. The codes are NumPy arrays if useNumpy
+        is set, or by default when NumPy is installed."""
+        if components is None:
+            components = self.components
+        if useNumpy is None:
+            useNumpy = _numpy() is not None
+        return componentTable(components, useNumpy)
+
     def getGroupDatasheet(self, group):
         """Return the whatever is known about the Datasheet by consulting each
         component in the group.  If any of them know something about the Datasheet,
@@ -776,29 +1373,335 @@ class netlist():
             print("NULL!")
         return ''
 
-    def formatXML(self):
-        """Return the whole netlist formatted in XML"""
-        return self.tree.formatXML()
-
-    def formatHTML(self):
-        """Return the whole netlist formatted in HTML"""
-        return self.tree.formatHTML()
-
-    def load(self, fname):
+    def formatXML(self, f=None):
+        """Return the whole netlist formatted in XML. If a (text) file
+        object f is given, the XML is written to it instead, as it is
+        generated, so the whole document is never in memory at once."""
+        if f is None:
+            return self.tree.formatXML()
+        _writeChunks(f, self.tree.iterXML())
+
+    def formatHTML(self, f=None):
+        """Return the whole netlist formatted in HTML, or write it to the
+        file object f, see formatXML()"""
+        if f is None:
+            return self.tree.formatHTML()
+        _writeChunks(f, self.tree.iterHTML())
+
+    def load(self, fname, skip=(), backend="auto", cacheDir=None):
         """Load a kicad generic netlist
 
         Keywords:
         fname -- The name of the generic netlist file to open
+        skip -- Names of elements that are skipped while parsing, together
+                with everything inside them. For example, ('nets', 'libraries')
+                loads everything a BOM needs, but is a lot faster and uses
+                much less memory on large designs because the nets are not
+                loaded.
+        backend -- The XML parser to use:
+                "sax": xml.sax, with a callback per element and text chunk
+                "etree": xml.etree.ElementTree.iterparse
+                "lxml": lxml.etree.iterparse (lxml must be installed)
+                "auto": lxml if it is installed, "sax" otherwise
+                All backends build the same netlist.
+        cacheDir -- If set, a snapshot of the parsed netlist is stored in this
+                directory, and used instead of parsing the file the next time
+                the same file is loaded. Snapshots are keyed by the file's size,
+                mtime and content hash (and skip), see cache_max_bytes for
+                the size limit of the directory. If the snapshot can't be
+                written, a warning is printed and the netlist is used as is.
+                Only use a directory that can't be written by others: a
+                snapshot is trusted to hold the netlist of the file. Snapshots
+                only hold plain data, see _snapshotUnpickler.
 
         """
+        if backend == "auto":
+            backend = "lxml" if _lxml_etree is not None else "sax"
+
         try:
-            self._reader = sax.make_parser()
-            self._reader.setContentHandler(_gNetReader(self))
-            self._reader.parse(fname)
+            if cacheDir:
+                cacheFile = os.path.join(cacheDir, _cacheKey(fname, skip) + ".netlist")
+                if self._loadSnapshot(cacheFile):
+                    return
+
+            if backend == "sax":
+                self._reader = sax.make_parser()
+                self._reader.setContentHandler(_gNetReader(self, skip))
+                self._reader.parse(fname)
+            elif backend == "etree":
+                self._iterparse(ElementTree.iterparse, fname, skip)
+            elif backend == "lxml":
+                if _lxml_etree is None:
+                    raise ValueError("lxml backend selected, but lxml is not installed")
+                self._iterparse(_lxml_etree.iterparse, fname, skip)
+            else:
+                raise ValueError("unknown netlist parser backend: " + str(backend))
+
+            if cacheDir:
+                # The netlist is parsed: a cache that can't be written (e.g. a
+                # missing or read-only directory, a full disk) is not an error
+                try:
+                    self._storeSnapshot(cacheFile)
+                except OSError as e:
+                    print( __file__, ": could not write netlist cache", cacheFile, ":", e, file=sys.stderr )
         except IOError as e:
             print( __file__, ":", e, file=sys.stderr )
             sys.exit(-1)
 
+    def _loadSnapshot(self, cacheFile):
+        """Restore the parsed netlist from a cache snapshot. Returns False if
+        there is no usable snapshot.
+        """
+        # The snapshot consists of a lot of small objects, none of them
+        # garbage: the cyclic garbage collector would only slow down loading
+        gcWasEnabled = gc.isenabled()
+        gc.disable()
+        try:
+            try:
+                with open(cacheFile, "rb") as f:
+                    version, tree = _snapshotUnpickler(f).load()
+            except FileNotFoundError:
+                return False
+            except Exception as e:
+                # Corrupt or incompatible snapshot: just parse the file again
+                print( __file__, ": ignoring netlist cache", cacheFile, ":", e, file=sys.stderr )
+                return False
+
+            if version != CACHE_VERSION:
+                return False
+
+            # Build the netlist from the snapshot like from the parser, so the
+            # components, libparts and their records are built by the current
+            # code (e.g. with the current footprint translation rules)
+            self._restoreTree(tree)
+            self.endDocument()
+        finally:
+            if gcWasEnabled:
+                gc.enable()
+
+        # Mark the snapshot as recently used, for _evictSnapshots()
+        try:
+            os.utime(cacheFile)
+        except OSError:
+            pass
+        return True
+
+    def _storeSnapshot(self, cacheFile):
+        """Write the parsed netlist to a cache snapshot. The snapshot is the
+        tree of the loaded sections (e.g. design, components and libparts for
+        BOM.py) as plain tuples: everything else is derived from it when the
+        snapshot is loaded."""
+        cacheDir = os.path.dirname(cacheFile)
+        os.makedirs(cacheDir, exist_ok=True)
+
+        tree = _snapshotTree(self.tree)
+
+        # Write to a temporary file first, so a concurrent run never sees a
+        # partially written snapshot
+        tmpFile = cacheFile + "." + str(os.getpid()) + ".tmp"
+        try:
+            with open(tmpFile, "wb") as f:
+                pickle.dump((CACHE_VERSION, tree), f, pickle.HIGHEST_PROTOCOL)
+            os.replace(tmpFile, cacheFile)
+        except OSError:
+            try:
+                os.remove(tmpFile)
+            except OSError:
+                pass
+            raise
+
+        _evictSnapshots(cacheDir, keep=cacheFile)
+
+    def _restoreTree(self, tree):
+        """Build the netlist from a snapshot tree (see _snapshotTree()),
+        passing each element on to addElement() / addChars() / endElement()
+        like the parser backends do."""
+        addElement = self.addElement
+        endElement = self.endElement
+
+        # Depth first: the stack holds an iterator over the remaining
+        # children of each open element, below one over the root
+        stack = [iter((tree,))]
+        while stack:
+            node = next(stack[-1], None)
+            if node is None:
+                stack.pop()
+                if stack:
+                    endElement()
+                continue
+
+            name, attributes, chars, children = node
+            element = addElement(name)
+            if attributes:
+                element.addAttributes(attributes)
+            if chars:
+                element.addChars(chars)
+            if children:
+                stack.append(iter(children))
+            else:
+                endElement()
+
+    def _iterparse(self, iterparse, fname, skip):
+        """Build the netlist tree from the events of an ElementTree style
+        iterparse(). Like the SAX backend, each parsed element is passed on to
+        addElement() / addChars() / endElement(). The parser's own elements
+        are cleared and dropped as soon as they are processed, so the file is
+        never held in memory twice.
+
+        Text after a child element (mixed content) does not occur in KiCad
+        netlists and is ignored.
+        """
+        skip = frozenset(skip)
+        skipDepth = 0
+
+        # The parser's elements from the root to the current element
+        stack = []
+
+        # Local names: this loop runs for every element in the file
+        intern = sys.intern
+        push = stack.append
+        pop = stack.pop
+        addElement = self.addElement
+        endElement = self.endElement
+
+        for event, elem in iterparse(fname, events=("start", "end")):
+            if event == "start":
+                push(elem)
+                if skipDepth or elem.tag in skip:
+                    skipDepth += 1
+                    continue
+
+                element = addElement(intern(elem.tag))
+                if len(elem.attrib):
+                    element.addAttributes({intern(k): v for k, v in elem.attrib.items()})
+                continue
+
+            pop()
+            if skipDepth:
+                skipDepth -= 1
+            else:
+                text = elem.text
+                if text:
+                    text = _elementChars(text)
+                    if text:
+                        self._curr_element.addChars(text)
+                endElement()
+
+            elem.clear()
+            if stack:
+                stack[-1].remove(elem)
+
+        self.endDocument()
+
+
+
+def _cacheKey(fname, skip):
+    """Return the netlist cache key of a file: a hash over the cache version,
+    the file's size, mtime and content, and the skipped sections.
+    """
+    st = os.stat(fname)
+
+    content = hashlib.sha256()
+    with open(fname, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            content.update(chunk)
+
+    key = hashlib.sha256()
+    for part in (CACHE_VERSION, st.st_size, st.st_mtime_ns, content.hexdigest(), sorted(skip)):
+        key.update(repr(part).encode("utf-8"))
+    return key.hexdigest()
+
+
+def _snapshotTree(element):
+    """Return an element and everything in it as nested plain tuples of
+    (name, attributes or None, chars, tuple of children or None)"""
+    return (element.name, dict(element.attributes) or None, element.chars,
+            tuple(_snapshotTree(c) for c in element.children) or None)
+
+
+class _snapshotUnpickler(pickle.Unpickler):
+    """Unpickler for cache snapshots. Snapshots only hold plain data (tuples,
+    dicts, strings): refusing all classes and functions means a snapshot
+    can't make the unpickler run code."""
+    def find_class(self, module, name):
+        raise pickle.UnpicklingError("unexpected object in netlist cache: " + module + "." + name)
+
+
+def _evictSnapshots(cacheDir, keep=None):
+    """Remove the least recently used snapshots from a cache directory until
+    their total size is at most cache_max_bytes. The snapshot 'keep' (the one
+    that was just written) is never removed.
+    """
+    snapshots = []
+    try:
+        names = os.listdir(cacheDir)
+    except OSError:
+        return
+    for name in names:
+        if not name.endswith(".netlist"):
+            continue
+        path = os.path.join(cacheDir, name)
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        snapshots.append((st.st_mtime, st.st_size, path))
+
+    total = sum(size for mtime, size, path in snapshots)
+    for mtime, size, path in sorted(snapshots):
+        if total <= cache_max_bytes:
+            break
+        if path == keep:
+            continue
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
+
+
+def _xmlText(text):
+    """Escape text for XML (or HTML) content"""
+    # Most text has nothing to escape
+    if "&" in text or "<" in text or ">" in text:
+        return saxutils.escape(text)
+    return text
+
+_xmlAttrSpecial = re.compile('[&<>"\n\r\t]')
+_xmlAttrEntities = {"\"": "&quot;", "\n": "&#10;", "\r": "&#13;", "\t": "&#9;"}
+
+def _xmlAttr(value):
+    """Escape and quote an XML attribute value"""
+    if _xmlAttrSpecial.search(value):
+        value = saxutils.escape(value, _xmlAttrEntities)
+    return "\"" + value + "\""
+
+# Size of the chunks written by _writeChunks()
+write_buffer_size = 64 * 1024
+
+def _writeChunks(f, chunks):
+    """Write the strings from the iterable chunks to the file object f,
+    collected in writes of about write_buffer_size characters"""
+    buf = []
+    size = 0
+    for chunk in chunks:
+        buf.append(chunk)
+        size += len(chunk)
+        if size >= write_buffer_size:
+            f.write("".join(buf))
+            buf = []
+            size = 0
+    if buf:
+        f.write("".join(buf))
+
+def _elementChars(text):
+    """Return the characters an element keeps from the text in it, for all
+    backends: lines that are empty or only white space (e.g. the indentation
+    around child elements) are dropped, and the other lines are joined.
+    """
+    if not "\n" in text:
+        return text if not text.isspace() else ""
+    return "".join(line for line in text.split("\n") if line and not line.isspace())
 
 
 class _gNetReader(sax.handler.ContentHandler):
@@ -806,24 +1709,58 @@ class _gNetReader(sax.handler.ContentHandler):
     to the 'netlist' class which builds a complete tree in RAM for the design
 
     """
-    def __init__(self, aParent):
+    def __init__(self, aParent, skip=()):
         self.parent = aParent
 
+        # Element names to skip, and how deep we are inside a skipped element
+        self.skip = frozenset(skip)
+        self._skipDepth = 0
+
+        # Text chunks since the last tag. Expat splits text at line ends and
+        # at every entity or character reference, so the text is only
+        # normalised once it is complete, like the etree backends do. The
+        # chunks are collected by the list's own append(): characters() is
+        # called for every chunk, including all the indentation
+        self._chars = []
+        self.characters = self._chars.append
+
+    def _flushChars(self):
+        """Pass the collected text on to the current element, or drop it
+        while skipping"""
+        chars = self._chars
+        text = "".join(chars)
+        del chars[:]
+        # Mostly the indentation between two tags
+        if text.isspace() or self._skipDepth:
+            return
+        text = _elementChars(text)
+        if text:
+            self.parent.addChars(text)
+
     def startElement(self, name, attrs):
         """Start of a new XML element event"""
-        element = self.parent.addElement(name)
+        if self._chars:
+            self._flushChars()
+        if self._skipDepth or name in self.skip:
+            self._skipDepth += 1
+            return
+
+        # Element and attribute names repeat for every element: intern them,
+        # so all elements share the same strings
+        intern = sys.intern
+        element = self.parent.addElement(intern(name))
 
-        for name in attrs.getNames():
-            element.addAttribute(name, attrs.getValue(name))
+        if attrs.getLength():
+            element.addAttributes({intern(k): v for k, v in attrs.items()})
 
     def endElement(self, name):
-        self.parent.endElement()
+        if self._chars:
+            self._flushChars()
+        if self._skipDepth:
+            self._skipDepth -= 1
+            return
 
-    def characters(self, content):
-        # Ignore erroneous white space - ignoreableWhitespace does not get rid
-        # of the need for this!
-        if not content.isspace():
-            self.parent.addChars(content)
+        self.parent.endElement()
 
     def endDocument(self):
         """End of the XML document event"""
@@ -0,0 +1,113 @@
+
+"""
+    @package
+    Opt-in timing and counters for the phases of a BOM sync.
+
+    Nothing is recorded until enable() is called: phase() then returns a
+    shared no-op context manager and count() returns immediately, so the
+    hooks can stay in place. Hot functions are not instrumented at all
+    unless they are wrapped with count_calls().
+
+    Usage:
+        sync_stats.enable()
+        with sync_stats.phase('parse'):
+            ...
+        sync_stats.count('rows scanned', n)
+        print(sync_stats.report())
+"""
+
+import contextlib
+import functools
+import json
+import time
+
+enabled = False
+
+# (name, nesting depth, seconds) per finished phase, in start order
+_phases = []
+_counters = {}
+_depth = 0
+
+_disabled_phase = contextlib.nullcontext()
+
+
+def enable():
+    """Start recording (and forget earlier recordings)"""
+    global enabled
+    enabled = True
+    reset()
+
+def disable():
+    global enabled
+    enabled = False
+
+def reset():
+    global _depth
+    del _phases[:]
+    _counters.clear()
+    _depth = 0
+
+
+def phase(name):
+    """Context manager that records the wall time of a phase. Phases can be
+    nested, e.g. libpart linking is part of parsing the netlist."""
+    if not enabled:
+        return _disabled_phase
+    return _timed_phase(name)
+
+@contextlib.contextmanager
+def _timed_phase(name):
+    global _depth
+    entry = [name, _depth, 0.0]
+    _phases.append(entry)
+    _depth += 1
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        entry[2] = time.perf_counter() - start
+        _depth -= 1
+
+
+def count(name, n=1):
+    """Add n to a counter"""
+    if not enabled:
+        return
+    _counters[name] = _counters.get(name, 0) + n
+
+def count_calls(func, name):
+    """Return a wrapper of func that counts its calls in counter name.
+    The caller installs the wrapper in place of func, only when profiling:
+    the unwrapped function has no overhead at all."""
+    _counters.setdefault(name, 0)
+    @functools.wraps(func)
+    def counting(*args, **kwargs):
+        _counters[name] = _counters.get(name, 0) + 1
+        return func(*args, **kwargs)
+    return counting
+
+
+def results():
+    """Return the recordings as a dict that can be written as JSON"""
+    return {
+        'phases': [{'name': name, 'depth': depth, 'seconds': seconds}
+                   for name, depth, seconds in _phases],
+        'counters': dict(_counters),
+    }
+
+def report():
+    """Return the recordings as printable text"""
+    lines = ["Timing:"]
+    for name, depth, seconds in _phases:
+        label = "  " * (depth + 1) + name
+        lines.append("{:<30} {:9.3f} s".format(label, seconds))
+    if _counters:
+        lines.append("Counters:")
+        for name in sorted(_counters):
+            lines.append("  {:<28} {:9d}".format(name, _counters[name]))
+    return "\n".join(lines)
+
+def save(fname):
+    """Write the recordings to a JSON file"""
+    with open(fname, 'w') as f:
+        json.dump(results(), f, indent=2)
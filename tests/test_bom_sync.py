@@ -0,0 +1,128 @@
+"""Syncing a netlist with the BOM sheet (BOM.sync_bom())"""
+
+import openpyxl
+import pytest
+
+import BOM
+
+R0603 = "Resistor_SMD:R_0603_1608Metric"
+C0402 = "Capacitor_SMD:C_0402_1005Metric"
+
+
+def write_netlist(path, components):
+    """Write a netlist with a component per (ref, value, footprint, MPN)"""
+    comps = []
+    for ref, value, footprint, mpn in components:
+        fields = ""
+        if mpn:
+            fields = '<fields><field name="MPN">{}</field></fields>'.format(mpn)
+        comps.append('<comp ref="{}"><value>{}</value><footprint>{}</footprint>{}'
+                     '<libsource lib="Device" part="R"/></comp>'.format(
+                         ref, value, footprint, fields))
+    path.write_text('<?xml version="1.0" encoding="UTF-8"?>\n'
+                    '<export version="D"><components>{}</components>'
+                    '<libparts><libpart lib="Device" part="R"/></libparts>'
+                    '</export>\n'.format("".join(comps)), encoding="utf-8")
+    return str(path)
+
+
+def write_sheet(path, values):
+    """Write a BOM sheet with a row per (value, translated footprint)"""
+    xls = openpyxl.Workbook()
+    xls.active.title = 'BOM'
+    BOM.init_BOM_sheet(xls)
+    sheet = xls['BOM']
+    for row_no, (value, footprint) in enumerate(values, 2):
+        sheet.cell(row=row_no, column=1).value = 1
+        sheet.cell(row=row_no, column=3).value = footprint
+        sheet.cell(row=row_no, column=4).value = value
+    xls.save(str(path))
+    return str(path)
+
+
+def column(path, name):
+    """Values of a column of the BOM sheet, without the header"""
+    sheet = openpyxl.load_workbook(str(path))['BOM']
+    headers = [cell.value for cell in sheet[1]]
+    return [row[headers.index(name)].value for row in sheet.iter_rows(min_row=2)]
+
+
+def test_new_rows_below_anchors(tmp_path):
+    # The sheet is not in part order: the new rows go below the row of the
+    # part before them, also below the last row
+    xlsx = write_sheet(tmp_path / "bom.xlsx", [
+        ("3k", "R 0603"), ("1k", "R 0603"), ("2k", "R 0603")])
+    netlist = write_netlist(tmp_path / "board.xml", [
+        ("R1", "1k", R0603, ""), ("R2", "1k5", R0603, ""),
+        ("R3", "2k", R0603, ""), ("R4", "2k2", R0603, ""),
+        ("R5", "2k5", R0603, ""), ("R6", "3k", R0603, ""),
+        ("R7", "4k", R0603, "")])
+
+    assert BOM.sync_bom(netlist, xlsx) == 0
+
+    assert column(xlsx, "Value") == ["3k", "4k", "1k", "1k5", "2k", "2k2", "2k5"]
+    assert column(xlsx, "Ref") == ["R6,", "R7,", "R1,", "R2,", "R3,", "R4,", "R5,"]
+    assert column(xlsx, "Sync") == [1] * 7
+
+
+def test_duplicate_key(tmp_path, capsys):
+    # '10k ' is a group of its own, with the key of '10k': it updates the
+    # new row of '10k', in part order
+    xlsx = str(tmp_path / "bom.xlsx")
+    netlist = write_netlist(tmp_path / "board.xml", [
+        ("R1", "10k", R0603, "MPN-A"), ("R2", "10k ", R0603, "MPN-B"),
+        ("C1", "100n", C0402, ""), ("R3", "1M", R0603, "")])
+
+    assert BOM.sync_bom(netlist, xlsx) == 0
+
+    assert column(xlsx, "Value") == ["100n", "10k", "1M"]
+    assert column(xlsx, "Ref") == ["C1,", "R2,", "R3,"]
+    assert column(xlsx, "MPN") == [None, "MPN-B", None]
+    sheet = openpyxl.load_workbook(xlsx)['BOM']
+    assert sheet['G3'].fill.fgColor.rgb == BOM.fills()['changed'].fgColor.rgb
+    assert sheet['D3'].fill.fgColor.rgb == BOM.fills()['new'].fgColor.rgb
+
+    out = capsys.readouterr().out.splitlines()
+    assert out[:7] == [
+        "New component found with value='100n', footprint '{}':".format(C0402),
+        "New component found with value='10k', footprint '{}':".format(R0603),
+        "Change(s) found for component with value='10k', footprint 'R 0603':",
+        "'Ref' changed from 'R1,' to 'R2,'",
+        "'MPN' changed from 'MPN-A' to 'MPN-B'",
+        "New component found with value='1M', footprint '{}':".format(R0603),
+        "Styling obsolete entries",
+    ]
+
+
+def test_no_changes_not_saved(tmp_path, capsys):
+    xlsx = tmp_path / "bom.xlsx"
+    netlist = write_netlist(tmp_path / "board.xml", [
+        ("R1", "10k", R0603, "MPN-A"), ("C1", "100n", C0402, "")])
+    assert BOM.sync_bom(netlist, str(xlsx)) == 0
+    # The next sync clears the 'new' fill of the Sync column
+    assert BOM.sync_bom(netlist, str(xlsx)) == 0
+    stamp = BOM.file_stamp(str(xlsx))
+    capsys.readouterr()
+
+    assert BOM.sync_bom(netlist, str(xlsx)) == 0
+
+    assert BOM.file_stamp(str(xlsx)) == stamp
+    assert "BOM is already in sync: {} not saved".format(xlsx) in capsys.readouterr().out
+
+
+@pytest.mark.parametrize("use_main", [True, False])
+def test_check(tmp_path, use_main):
+    output = str(tmp_path / "bom")
+    netlist = write_netlist(tmp_path / "board.xml", [("R1", "10k", R0603, "")])
+
+    def check():
+        if use_main:
+            return BOM.main(['--check', netlist, output])
+        return BOM.sync_bom(netlist, output + '.xlsx', BOM.SyncOptions(check=True))
+
+    assert check() == 1
+    assert BOM.main([netlist, output]) == 0
+    assert check() == 0
+
+    write_netlist(tmp_path / "board.xml", [("R1", "10k", R0603, "MPN-A")])
+    assert check() == 1
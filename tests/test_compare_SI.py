@@ -0,0 +1,25 @@
+"""SI value sorting (compare_SI.py)"""
+
+from functools import cmp_to_key
+
+import pytest
+
+from compare_SI import SI_key, compare_SI
+
+
+@pytest.mark.parametrize("values", [
+    ['10n', '(NC)', '1u', '+5V', 'ABC', '-12V', '100n'],
+    ['4nF', '18pF', '1k', '1.5k', '1M', '100', '0.1u', '2.2uF'],
+    ['DNI', '10k', '', '4k7', 'LED', '1N4148', '~', '+3V3', 'BAT54'],
+])
+def test_same_order_as_compare_SI(values):
+    assert sorted(values, key=SI_key) == sorted(values, key=cmp_to_key(compare_SI))
+
+
+def test_numbers_sort_numerically():
+    assert sorted(['4nF', '18pF', '1uF', '220pF'], key=SI_key) == ['18pF', '220pF', '4nF', '1uF']
+
+
+def test_text_around_numbers():
+    values = ['10n', '100n', '1u', 'ABC', '(NC)', '+5V', '-12V']
+    assert sorted(values, key=SI_key) == ['(NC)', '+5V', '-12V', '10n', '100n', '1u', 'ABC']
@@ -0,0 +1,88 @@
+"""Exclusion rules (netlist_reader.componentFilter)"""
+
+import re
+
+import pytest
+
+import netlist_reader
+
+NETLIST = """<?xml version="1.0" encoding="UTF-8"?>
+<export version="D">
+  <components>
+    <comp ref="R1">
+      <value>10k</value>
+      <footprint>Resistor_SMD:R_0603_1608Metric</footprint>
+      <libsource lib="Device" part="R"/>
+    </comp>
+    <comp ref="R2">
+      <value>DNI 1k</value>
+      <footprint>Resistor_SMD:R_0603_1608Metric</footprint>
+      <libsource lib="Device" part="R"/>
+    </comp>
+    <comp ref="H1">
+      <value>MountHole</value>
+      <footprint>MountingHole:MountingHole_3.2mm_M3</footprint>
+      <libsource lib="Device" part="R"/>
+    </comp>
+    <comp ref="R3">
+      <value>22k</value>
+      <footprint>Resistor_SMD:R_0603_1608Metric</footprint>
+      <fields>
+        <field name="Installed">NU</field>
+      </fields>
+      <libsource lib="Device" part="R"/>
+    </comp>
+  </components>
+  <libparts>
+    <libpart lib="Device" part="R"/>
+  </libparts>
+</export>
+"""
+
+
+@pytest.fixture
+def net(tmp_path):
+    fname = tmp_path / "board.xml"
+    fname.write_text(NETLIST, encoding="utf-8")
+    return netlist_reader.netlist(str(fname))
+
+
+def refs(components):
+    return [c.getRef() for c in components]
+
+
+def test_default_rules(net):
+    assert refs(net.getInterestingComponents()) == ["H1", "R1", "R2"]
+
+
+@pytest.mark.parametrize("values, expected", [
+    # Global flags at the start of an expression
+    (["(?i)mounthole"], ["R1", "R2", "R3"]),
+    (["(?i)(?s)mount.?hole", "DNI"], ["R1", "R3"]),
+    # Groups and backreferences keep their numbers
+    ([r"(\d)\1k", r"(?P<d>1)0(?P=d)?k"], ["R2", "H1"]),
+    # A verbose expression with a comment can't be merged
+    (["(?x) 1 0 k  # ten k", "M"], ["R2", "R3"]),
+])
+def test_values(net, values, expected):
+    rules = netlist_reader.componentFilter(values=values, fields={})
+    assert refs(rules.apply(net.components)) == expected
+
+
+def test_same_as_separate_matches(net):
+    values = ["(?i)mounthole", r"(\d)\1k", "DNI", "(?x) 2 2 k # comment"]
+    rules = netlist_reader.componentFilter(values=values, fields={})
+    expected = [c for c in net.components
+                if not any(re.match(rex, c.getValue()) for rex in values)]
+    assert rules.apply(net.components) == expected
+
+
+def test_module_lists(net, monkeypatch):
+    monkeypatch.setattr(netlist_reader, "excluded_values",
+                        netlist_reader.excluded_values + ["(?i)mounthole"])
+    assert refs(net.getInterestingComponents()) == ["R1", "R2"]
+
+
+def test_invalid_expression():
+    with pytest.raises(re.error):
+        netlist_reader.componentFilter(values=["(unclosed"])
@@ -0,0 +1,129 @@
+"""Columnar component table (netlist.getComponentTable())"""
+
+from array import array
+
+import pytest
+
+import netlist_reader
+
+NETLIST = """<?xml version="1.0" encoding="UTF-8"?>
+<export version="D">
+  <components>
+    <comp ref="R1">
+      <value>10k</value>
+      <footprint>Resistor_SMD:R_0603_1608Metric</footprint>
+      <fields>
+        <field name="MPN">RC0603-10K</field>
+        <field name="value">ten k</field>
+        <field name="libpart">other</field>
+      </fields>
+      <libsource lib="Device" part="R"/>
+    </comp>
+    <comp ref="R2">
+      <value>1k</value>
+      <footprint>Resistor_SMD:R_0603_1608Metric</footprint>
+      <libsource lib="Device" part="R"/>
+    </comp>
+    <comp ref="R3">
+      <value>10k</value>
+      <footprint>Resistor_SMD:R_0603_1608Metric</footprint>
+      <fields>
+        <field name="MPN">RC0603-10K</field>
+      </fields>
+      <libsource lib="Device" part="R"/>
+    </comp>
+    <comp ref="C1">
+      <value>100n</value>
+      <footprint>Capacitor_SMD:C_0402_1005Metric</footprint>
+      <libsource lib="Device" part="C"/>
+    </comp>
+  </components>
+  <libparts>
+    <libpart lib="Device" part="R">
+      <fields>
+        <field name="Reference">R</field>
+        <field name="Value">R</field>
+        <field name="Footprint">Resistor_SMD:R_0603_1608Metric</field>
+        <field name="Datasheet">~</field>
+        <field name="Tolerance">1%</field>
+        <field name="MPN">generic</field>
+      </fields>
+    </libpart>
+    <libpart lib="Device" part="C">
+      <fields>
+        <field name="Reference">C</field>
+        <field name="Value">C</field>
+      </fields>
+    </libpart>
+  </libparts>
+</export>
+"""
+
+
+@pytest.fixture
+def net(tmp_path):
+    fname = tmp_path / "board.xml"
+    fname.write_text(NETLIST, encoding="utf-8")
+    return netlist_reader.netlist(str(fname))
+
+
+def test_columns(net):
+    table = net.getComponentTable(useNumpy=False)
+
+    assert isinstance(table.getCodes("ref"), array)
+    assert table.getFieldNames() == ["MPN", "Tolerance"]
+    assert table.getStrings("ref") == ["R1", "R2", "R3", "C1"]
+    assert table.getStrings("MPN") == ["RC0603-10K", "generic", "RC0603-10K", ""]
+    assert table.getStrings("Tolerance") == ["1%", "1%", "1%", ""]
+    assert table.getValues("value") == ["", "10k", "1k", "100n"]
+
+
+def test_no_mandatory_libpart_fields(net):
+    table = net.getComponentTable(useNumpy=False)
+
+    for name in ("Reference", "Value", "Footprint", "Datasheet"):
+        assert not name in table.getColumnNames()
+    # The component fields are a subset of the user fields
+    fields = net.gatherComponentFieldUnion() - set(table.propertyColumns)
+    assert fields <= set(table.getFieldNames())
+
+
+def test_fields_dont_replace_properties(net):
+    table = net.getComponentTable(useNumpy=False)
+
+    assert table.getStrings("value") == ["10k", "1k", "10k", "100n"]
+    assert table.getStrings("libpart") == ["Device:R", "Device:R", "Device:R", "Device:C"]
+
+
+def test_queries(net):
+    table = net.getComponentTable(useNumpy=False)
+
+    assert table.select("value", "10k") == [0, 2]
+    assert table.select("value", "47k") == []
+    assert table.selectMatching("ref", "R") == [0, 1, 2]
+    assert table.groupBy("value", "translatedFootprint") == {
+        ("10k", "R 0603"): [0, 2],
+        ("1k", "R 0603"): [1],
+        ("100n", "C 0402"): [3],
+    }
+    assert [c.getRef() for c in table.getRows([1, 3])] == ["R2", "C1"]
+
+
+def test_numpy(net):
+    numpy = pytest.importorskip("numpy")
+    table = net.getComponentTable(useNumpy=True)
+
+    codes = table.getCodes("MPN")
+    assert isinstance(codes, numpy.ndarray)
+    assert codes.dtype == numpy.intc
+    assert (codes == 0).nonzero()[0].tolist() == [1, 3]
+
+    assert table.select("value", "10k") == [0, 2]
+    assert table.selectMatching("value", "1") == [0, 1, 2, 3]
+    assert table.groupBy("value") == {("10k",): [0, 2], ("1k",): [1], ("100n",): [3]}
+    assert table.getStrings("ref") == ["R1", "R2", "R3", "C1"]
+
+    # The same table as without NumPy
+    plain = net.getComponentTable(useNumpy=False)
+    for name in plain.getColumnNames():
+        assert table.getStrings(name) == plain.getStrings(name)
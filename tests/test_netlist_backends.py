@@ -0,0 +1,107 @@
+"""All netlist parser backends must build the same netlist"""
+
+import pytest
+
+import netlist_reader
+
+NETLIST = """<?xml version="1.0" encoding="UTF-8"?>
+<export version="D">
+  <design>
+    <source>/tmp/board.sch</source>
+    <tool>Eeschema 5.1.9</tool>
+  </design>
+  <components>
+    <comp ref="R1">
+      <value>10k</value>
+      <footprint>Resistor_SMD:R_0603_1608Metric</footprint>
+      <fields>
+        <field name="MPN">RC0603 &amp; co</field>
+      </fields>
+      <libsource lib="Device" part="R" description="Resistor"/>
+    </comp>
+    <comp ref="R2">
+      <value>x&amp; &amp;y</value>
+      <footprint>Resistor_SMD:R_0603_1608Metric</footprint>
+      <fields>
+        <field name="Note">tab&#9;&#9;end</field>
+        <field name="Code">&#65;&#x42;&lt;&gt;&quot;&apos;</field>
+        <field name="Blank">&#32;&#32;</field>
+      </fields>
+      <libsource lib="Device" part="R" description="Resistor"/>
+    </comp>
+    <comp ref="C1">
+      <value>100n</value>
+      <footprint>Capacitor_SMD:C_0402_1005Metric</footprint>
+      <fields>
+        <field name="Comment">first line
+          second line
+
+          third &amp; last line
+        </field>
+      </fields>
+      <libsource lib="Device" part="C" description="Capacitor"/>
+    </comp>
+  </components>
+  <libparts>
+    <libpart lib="Device" part="R">
+      <description>Resistor</description>
+    </libpart>
+    <libpart lib="Device" part="C">
+      <description>Capacitor</description>
+    </libpart>
+  </libparts>
+  <nets>
+    <net code="1" name="GND">
+      <node ref="R1" pin="1"/>
+      <node ref="C1" pin="2"/>
+    </net>
+  </nets>
+</export>
+"""
+
+BACKENDS = ["sax", "etree"]
+if netlist_reader._lxml_etree is not None:
+    BACKENDS.append("lxml")
+
+
+def tree(element):
+    return (element.name, sorted(element.attributes.items()), element.chars,
+            [tree(c) for c in element.children])
+
+
+def records(net):
+    return [(r.ref, r.value, r.footprint, r.translatedFootprint, r.description, r.dnp, r.fields)
+            for r in (c.getRecord() for c in net.components)]
+
+
+@pytest.fixture
+def netlist_file(tmp_path):
+    fname = tmp_path / "board.xml"
+    fname.write_text(NETLIST, encoding="utf-8")
+    return str(fname)
+
+
+@pytest.mark.parametrize("skip", [(), ("nets", "libraries")])
+@pytest.mark.parametrize("backend", BACKENDS[1:])
+def test_same_netlist_as_sax(netlist_file, backend, skip):
+    sax = netlist_reader.netlist(netlist_file, skip, backend="sax")
+    other = netlist_reader.netlist(netlist_file, skip, backend=backend)
+
+    assert tree(other.tree) == tree(sax.tree)
+    assert records(other) == records(sax)
+    assert len(other.nets) == len(sax.nets)
+    assert len(other.libparts) == len(sax.libparts)
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_text(netlist_file, backend):
+    net = netlist_reader.netlist(netlist_file, backend=backend)
+    r1, r2, c1 = net.components
+
+    assert r1.getField("MPN") == "RC0603 & co"
+    assert r2.getValue() == "x& &y"
+    assert r2.getField("Note") == "tab\t\tend"
+    assert r2.getField("Code") == "AB<>\"'"
+    assert r2.getField("Blank") == ""
+    assert c1.getField("Comment") == "first line          second line          third & last line"
+    assert net.getSource() == "/tmp/board.sch"
@@ -1,11 +1,13 @@
+
 import re
+from functools import lru_cache
 
 def _substr_after(s, delim):
     return s.partition(delim)[2]
 
 passive_package_regex = re.compile('(^.*\s+[0-9]+)\s+[0-9]+(M|m)etric$')
 
-def translate_fp(fp_string):
+def default_rules(fp_string):
     """
     Translate a footprint to a simpler human-readable format
 
@@ -15,11 +17,6 @@ def translate_fp(fp_string):
     correctly group parts based on them
     """
 
-    if not fp_string:
-        return ""
-
-    if not isinstance(fp_string, str):
-        fp_string = str(fp_string)
     result = fp_string
 
     # Try to remove the library prefix
@@ -37,4 +34,48 @@ def translate_fp(fp_string):
 
     return result
 
+_rules = default_rules
+
+# Bounded: remembers the translations of up to 4096 distinct footprints
+@lru_cache(maxsize=4096)
+def _translate_cached(fp_string):
+    return _rules(fp_string)
+
+def translate_fp(fp_string):
+    """
+    Translate a footprint to a simpler human-readable format, see
+    default_rules(). Results are memoized: the number of distinct
+    footprints in a design is small, while they are translated very often.
+    """
+
+    if not fp_string:
+        return ""
+
+    if not isinstance(fp_string, str):
+        fp_string = str(fp_string)
+
+    return _translate_cached(fp_string)
+
+def translate_fps(fp_strings):
+    """Translate all footprints in an iterable, returns a list"""
+    return [translate_fp(fp) for fp in fp_strings]
+
+def cache_info():
+    """Return the memoization statistics (hits, misses, maxsize, currsize)"""
+    return _translate_cached.cache_info()
 
+def clear_cache():
+    """Forget all memoized translations"""
+    _translate_cached.cache_clear()
+
+def set_rules(rules):
+    """
+    Replace the translation rules by a function that takes a non-empty
+    footprint string and returns its translation. Pass default_rules to
+    restore the original behaviour. Returns the previous rules.
+    """
+    global _rules
+    previous = _rules
+    _rules = rules
+    clear_cache()
+    return previous